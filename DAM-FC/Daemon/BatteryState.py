@@ -0,0 +1,121 @@
+# DAMFC_BatteryState v0.1.0
+# All battery readings in one pass over sysfs handles that stay open
+
+import os
+import glob
+import logging
+import threading
+
+WMI_ATTRIBUTES = ("health_mode", "calibration_mode", "temperature")
+POWER_SUPPLY_ATTRIBUTES = ("status", "power_now", "energy_now")
+
+
+class BatteryState:
+    """
+    Reads the acer-wmi-battery attributes and the /sys/class/power_supply/BAT* fields
+    with os.pread on file descriptors opened once. The WMI attributes are only read
+    while `is_loaded()` reports the battery driver as present; their handles are
+    dropped when it is not, since the attributes vanish with the driver.
+    """
+
+    def __init__(self, wmi_dir, is_loaded, power_supply_root="/sys/class/power_supply"):
+        self.wmi_dir = wmi_dir
+        self.is_loaded = is_loaded
+        self.power_supply_root = power_supply_root
+        self.supply = None  # Name of the BAT* supply, found on first read
+        self._wmi_fds = {}
+        self._supply_fds = {}
+        self._lock = threading.Lock()  # The sampler and IPC commands both read
+
+    def read(self):
+        """Return every battery field; -1 for WMI values that are unavailable, like DriverManager."""
+        with self._lock:
+            loaded = self.is_loaded()
+            if loaded:
+                wmi = {name: self._read_wmi(name) for name in WMI_ATTRIBUTES}
+            else:
+                self._close(self._wmi_fds)
+                wmi = dict.fromkeys(WMI_ATTRIBUTES)
+            supply = self._read_supply()
+
+        power_now = supply.get("power_now")
+        energy_now = supply.get("energy_now")
+        return {
+            'driver_loaded': loaded,
+            'health_mode': -1 if wmi["health_mode"] is None else int(wmi["health_mode"]),
+            'calibration_mode': -1 if wmi["calibration_mode"] is None else int(wmi["calibration_mode"]),
+            'temperature': -1 if wmi["temperature"] is None else int(wmi["temperature"]) / 100.0,
+            'power_supply': self.supply,
+            'status': supply.get("status"),
+            # The kernel reports µW and µWh
+            'power_now_w': None if power_now is None else int(power_now) / 1_000_000,
+            'energy_now_wh': None if energy_now is None else int(energy_now) / 1_000_000
+        }
+
+    def temperature(self):
+        """Battery temperature in °C, or None when the battery driver is not loaded."""
+        with self._lock:
+            if not self.is_loaded():
+                self._close(self._wmi_fds)
+                return None
+            raw = self._read_wmi("temperature")
+        return None if raw is None else int(raw) / 100.0
+
+    def close(self):
+        """Release every handle; the next read reopens them (e.g. after a driver reload)."""
+        with self._lock:
+            self._close(self._wmi_fds)
+            self._close(self._supply_fds)
+            self.supply = None
+
+    def _read_wmi(self, name):
+        value = self._pread(self._wmi_fds, os.path.join(self.wmi_dir, name))
+        try:
+            return None if value is None else int(value)
+        except ValueError:
+            return None
+
+    def _read_supply(self):
+        if self.supply is None:
+            batteries = sorted(glob.glob(os.path.join(self.power_supply_root, "BAT*")))
+            if not batteries:
+                return {}
+            self.supply = os.path.basename(batteries[0])
+        directory = os.path.join(self.power_supply_root, self.supply)
+        values = {}
+        for name in POWER_SUPPLY_ATTRIBUTES:
+            value = self._pread(self._supply_fds, os.path.join(directory, name))
+            if value is not None:
+                values[name] = value
+        return values
+
+    @staticmethod
+    def _pread(fds, path):
+        """Read a sysfs attribute through its cached fd, reopening it once if it went stale."""
+        for attempt in range(2):
+            fd = fds.get(path)
+            try:
+                if fd is None:
+                    fd = os.open(path, os.O_RDONLY)
+                    fds[path] = fd
+                return os.pread(fd, 64, 0).decode().strip()
+            except OSError as e:
+                BatteryState._close_one(fds, path)
+                if attempt or isinstance(e, FileNotFoundError):
+                    logging.debug(f"Cannot read {path}: {e}")
+                    return None
+        return None
+
+    @staticmethod
+    def _close_one(fds, path):
+        fd = fds.pop(path, None)
+        if fd is not None:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _close(fds):
+        for path in list(fds):
+            BatteryState._close_one(fds, path)
@@ -0,0 +1,218 @@
+# Stress test for config updates racing the fan control loop
+#   python3 Benchmarks/config_swap_stress.py [--writers N] [--duration S] [--json]
+#
+# Starts a FanControlDaemon on the simulated tree of ipc_bench.py with a fast poll
+# interval and a rapidly drifting CPU temperature, then has several session clients
+# flip between two configs (and toggle dynamic mode) as fast as they can.
+#
+# The two configs are chosen so every speed a consistent tick can write belongs to a
+# known set, while mixing one config's curve with the other's clamp bounds produces a
+# speed outside it:
+#   A: bounds 500..3000, curve 40 °C -> 600,  60 °C -> 2900
+#   B: bounds 1000..2000, curve 40 °C -> 1200, 60 °C -> 1800
+# A curve from A clamped by B gives 1000 or 2000. The regular files standing in for
+# /dev/fan1 and /dev/fan2 keep every value written, and any write outside
+# {600, 2900, 1200, 1800} is reported as a torn tick (exit status 1).
+#
+# Finally the daemon is stopped while a subscribe session is still connected; the
+# socket server has to return (and cleanup() run) regardless, or the run fails too.
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ipc_bench import build_fake_tree
+
+POLL = {'poll_min_ms': 10, 'poll_max_ms': 20, 'sample_interval_ms': 10}
+CONFIG_A = dict(POLL, min_speed=500, max_speed=3000, temp_steps=[
+    {'temperature': 40, 'speed': 600}, {'temperature': 60, 'speed': 2900}
+])
+CONFIG_B = dict(POLL, min_speed=1000, max_speed=2000, temp_steps=[
+    {'temperature': 40, 'speed': 1200}, {'temperature': 60, 'speed': 1800}
+])
+CONSISTENT_SPEEDS = {600, 2900, 1200, 1800}
+
+
+def drift_temperatures(hwmon, stop):
+    """Random-walk the CPU temperature across both curve steps every few milliseconds."""
+    path = os.path.join(hwmon, 'hwmon0', 'temp1_input')
+    temp = 50.0
+    while not stop.wait(0.002):
+        temp = min(80.0, max(30.0, temp + random.uniform(-4, 4)))
+        with open(path, 'w') as f:
+            f.write(f"{int(temp * 1000)}\n")
+
+
+def start_daemon(root):
+    import logging
+    import HardwareStatus
+    from DriverManager import DriverManager, ModuleStateCache
+    from DAMFC_daemon2 import FanControlDaemon
+
+    hwmon, dev, battery, proc = build_fake_tree(root)
+    HardwareStatus.set_hwmon_engine(HardwareStatus.HwmonSensorEngine(hwmon))
+    HardwareStatus.set_gpu_backend(HardwareStatus.FakeGpuBackend(30))
+    DriverManager.set_battery_sysfs_path(battery)
+    DriverManager.modules = ModuleStateCache(proc)
+
+    config_path = os.path.join(root, 'config.json')
+    with open(config_path, 'w') as f:
+        json.dump(dict(CONFIG_A, battery={'auto_load_battery_driver': False}), f)
+
+    daemon = FanControlDaemon(
+        config_path=config_path,
+        socket_path=os.path.join(root, 'daemon.sock'),
+        log_dir=os.path.join(root, 'log'),
+        dev_root=dev
+    )
+    logging.disable(logging.CRITICAL)
+    daemon.start(load_drivers=False)
+    server = threading.Thread(target=daemon.handle_socket_commands, daemon=True)
+    server.start()
+
+    deadline = time.monotonic() + 5
+    while daemon.socket_ready_at is None:
+        if time.monotonic() > deadline:
+            raise RuntimeError("Daemon socket did not come up")
+        time.sleep(0.01)
+    return daemon, hwmon, dev, server
+
+
+def writer(socket_path, index, deadline, results):
+    from IpcServer import IpcClient, IpcError
+
+    client = IpcClient(socket_path, timeout=10)
+    updates = toggles = errors = 0
+    latencies = []
+    try:
+        while time.monotonic() < deadline:
+            config = CONFIG_A if (updates + index) % 2 == 0 else CONFIG_B
+            start = time.perf_counter()
+            try:
+                client.request('update_config', config=config)
+                updates += 1
+                if updates % 25 == 0:
+                    client.request('set_dynamic_mode', toActivate=bool(toggles % 2))
+                    toggles += 1
+            except IpcError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+        # Leave dynamic control on so the last config is exercised too
+        client.request('set_dynamic_mode', toActivate=True)
+    finally:
+        client.close()
+    results[index] = {'updates': updates, 'toggles': toggles, 'errors': errors, 'latencies': latencies}
+
+
+def written_speeds(dev):
+    speeds = {}
+    for fan in ('fan1', 'fan2'):
+        with open(os.path.join(dev, fan)) as f:
+            speeds[fan] = [int(line) for line in f if line.strip()]
+    return speeds
+
+
+def stop_with_open_session(daemon, server, timeout=5.0):
+    """Stop the daemon while a subscriber is connected; returns the seconds it took or None."""
+    from IpcServer import IpcClient
+
+    subscriber = IpcClient(daemon.socket_path, timeout=timeout)
+    try:
+        subscriber.request('subscribe', interval_ms=100)
+        start = time.monotonic()
+        daemon.ipc_server.stop()
+        server.join(timeout)
+        if server.is_alive():
+            return None
+        daemon.cleanup()
+        return time.monotonic() - start
+    finally:
+        subscriber.close()
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] if ordered else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress config updates against the fan loop")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    # Switch threads far more often than the default 5 ms so races get a chance to show
+    sys.setswitchinterval(1e-5)
+
+    root = tempfile.mkdtemp(prefix="damfc_stress_")
+    stop = threading.Event()
+    try:
+        daemon, hwmon, dev, server = start_daemon(root)
+        threading.Thread(target=drift_temperatures, args=(hwmon, stop), daemon=True).start()
+        time.sleep(0.2)  # Let the loop run on the initial config first
+
+        results = {}
+        deadline = time.monotonic() + args.duration
+        threads = [
+            threading.Thread(target=writer, args=(daemon.socket_path, index, deadline, results))
+            for index in range(args.writers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        time.sleep(0.2)
+        stop.set()
+
+        speeds = written_speeds(dev)
+        torn = {fan: sorted(set(values) - CONSISTENT_SPEEDS) for fan, values in speeds.items()}
+        latencies = [latency for result in results.values() for latency in result['latencies']]
+        report = {
+            'writers': args.writers,
+            'duration_s': args.duration,
+            'updates': sum(result['updates'] for result in results.values()),
+            'dynamic_toggles': sum(result['toggles'] for result in results.values()),
+            'errors': sum(result['errors'] for result in results.values()),
+            'update_p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'update_p99_ms': round(percentile(latencies, 99) * 1000, 3),
+            'fan_loop_wakeups': {n: channel.scheduler.wakeups for n, channel in daemon.channels.items()},
+            'fan_writes': {fan: len(values) for fan, values in speeds.items()},
+            'torn_speeds': torn,
+        }
+        stop_s = stop_with_open_session(daemon, server)
+        report['stop_with_session_s'] = None if stop_s is None else round(stop_s, 3)
+    finally:
+        stop.set()
+        shutil.rmtree(root, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['writers']} writers for {report['duration_s']} s: {report['updates']} config updates "
+              f"({report['updates'] / report['duration_s']:.0f}/s), {report['dynamic_toggles']} dynamic mode "
+              f"toggles, {report['errors']} errors")
+        print(f"update_config latency p50 {report['update_p50_ms']} ms, p99 {report['update_p99_ms']} ms")
+        print(f"fan loop wakeups {report['fan_loop_wakeups']}, fan writes {report['fan_writes']}")
+        if any(torn.values()):
+            print(f"INCONSISTENT: speeds outside {sorted(CONSISTENT_SPEEDS)} were written: {torn}")
+        else:
+            print("No torn ticks: every write matched a single config")
+        if stop_s is None:
+            print("STUCK: the daemon did not stop while a session was connected")
+        else:
+            print(f"Stopped with a session connected in {stop_s * 1000:.0f} ms")
+    sys.exit(1 if any(torn.values()) or stop_s is None else 0)
+
+
+if __name__ == '__main__':
+    main()
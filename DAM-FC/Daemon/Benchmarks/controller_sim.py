@@ -0,0 +1,115 @@
+# Deterministic closed-loop simulation of the fan controllers
+#   python3 Benchmarks/controller_sim.py [--load-watts W] [--duration S] [--pid-target C]
+#
+# A first-order thermal model (heat capacity, load power, fan-speed dependent cooling)
+# is driven through the same FanChannel/AdaptiveInterval path the daemon uses, and each
+# controller is scored on peak temperature, overshoot, settling time, write count and
+# average fan effort after a step from idle to sustained load.
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from FanControl import FanChannel, FanCurve, build_controller
+from HardwareStatus import HardwareSnapshot
+
+MIN_SPEED = 640
+MAX_SPEED = 2560
+TEMP_STEPS = [
+    {'temperature': 50, 'speed': 1024},
+    {'temperature': 70, 'speed': 1536},
+    {'temperature': 80, 'speed': 2048}
+]
+
+
+class ThermalModel:
+    """C * dT/dt = P - h(speed) * (T - T_ambient), with h growing linearly with fan speed."""
+
+    def __init__(self, ambient=25.0, capacity=60.0, h_idle=0.3, h_fan=1.2):
+        self.ambient = ambient
+        self.capacity = capacity
+        self.h_idle = h_idle
+        self.h_fan = h_fan
+        self.temp = ambient + 15
+
+    def step(self, power, speed, dt):
+        h = self.h_idle + self.h_fan * speed / MAX_SPEED
+        self.temp += (power - h * (self.temp - self.ambient)) / self.capacity * dt
+
+
+def simulate(controller_spec, load_watts, duration, load_start=30.0, dt=0.05):
+    channel = FanChannel(1)
+    curve = FanCurve(TEMP_STEPS)
+    channel.configure("cpu", 0.0, build_controller(controller_spec, curve, MIN_SPEED, MAX_SPEED))
+
+    model = ThermalModel()
+    speed = MIN_SPEED
+    writes = 0
+    effort = 0.0
+    trace = []
+
+    now = 0.0
+    while now < duration:
+        if now >= channel.next_due:
+            # The daemon sees whole degrees, exactly like the hwmon readings
+            snapshot = HardwareSnapshot(cpu_temp=int(round(model.temp)), timestamp=now, monotonic=now)
+            target = channel.evaluate(snapshot, now)
+            if target is not None:
+                target = min(max(target, MIN_SPEED), MAX_SPEED)
+                if target != speed:
+                    # FanActuator only writes values that changed
+                    writes += 1
+                    speed = target
+
+        power = load_watts if now >= load_start else 10.0
+        model.step(power, speed, dt)
+        effort += speed * dt
+        trace.append((now, model.temp))
+        now += dt
+
+    loaded = [(t, temp) for t, temp in trace if t >= load_start]
+    tail = [temp for t, temp in loaded if t >= duration - 60]
+    final = sum(tail) / len(tail)
+    peak = max(temp for _, temp in loaded)
+
+    settling = None
+    for t, temp in reversed(loaded):
+        if abs(temp - final) > 2.0:
+            settling = t - load_start
+            break
+
+    return {
+        'peak': peak,
+        'final': final,
+        'overshoot': peak - final,
+        'settling': settling if settling is not None else 0.0,
+        'tail_swing': max(tail) - min(tail),
+        'writes': writes,
+        'effort': effort / duration
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fan controller simulation")
+    parser.add_argument("--load-watts", type=float, default=45.0)
+    parser.add_argument("--duration", type=float, default=900.0)
+    parser.add_argument("--pid-target", type=float, default=75.0)
+    args = parser.parse_args()
+
+    controllers = [
+        ("step table", "curve"),
+        (f"pid @ {args.pid_target:g} °C", {"type": "pid", "target": args.pid_target}),
+    ]
+
+    print(f"load {args.load_watts:g} W for {args.duration:g} s")
+    print(f"{'controller':<16}{'peak °C':>9}{'final °C':>10}{'overshoot':>11}{'settle s':>10}"
+          f"{'swing °C':>10}{'writes':>8}{'avg speed':>11}")
+    for name, spec in controllers:
+        r = simulate(spec, args.load_watts, args.duration)
+        print(f"{name:<16}{r['peak']:>9.1f}{r['final']:>10.1f}{r['overshoot']:>11.1f}{r['settling']:>10.1f}"
+              f"{r['tail_swing']:>10.1f}{r['writes']:>8}{r['effort']:>11.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# Microbenchmark: compiled FanCurve lookup vs. the old per-tick sort of temp_steps
+#   python3 Benchmarks/fan_curve_bench.py [--iterations N]
+
+import os
+import sys
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from FanControl import FanCurve
+
+TEMP_STEPS = [
+    {'temperature': 40, 'speed': 768},
+    {'temperature': 50, 'speed': 1024},
+    {'temperature': 60, 'speed': 1280},
+    {'temperature': 70, 'speed': 1536},
+    {'temperature': 80, 'speed': 2048},
+    {'temperature': 90, 'speed': 2560}
+]
+TEMPS = list(range(30, 100))
+
+
+def sorted_scan(temp_steps, temp):
+    """The lookup dynamic_fan_control used to run on every tick."""
+    for step in sorted(temp_steps, key=lambda x: x['temperature'], reverse=True):
+        if temp >= step['temperature']:
+            return step['speed']
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fan curve lookup microbenchmark")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    step_curve = FanCurve(TEMP_STEPS, "step")
+    linear_curve = FanCurve(TEMP_STEPS, "linear")
+
+    # The compiled step curve must keep the old semantics exactly
+    for temp in TEMPS:
+        assert step_curve.speed(temp) == sorted_scan(TEMP_STEPS, temp), temp
+
+    lookups = args.iterations * len(TEMPS)
+    cases = [
+        ("per-tick sort + scan", lambda: [sorted_scan(TEMP_STEPS, t) for t in TEMPS]),
+        ("FanCurve step", lambda: [step_curve.speed(t) for t in TEMPS]),
+        ("FanCurve linear", lambda: [linear_curve.speed(t) for t in TEMPS]),
+        ("FanCurve compile", lambda: FanCurve(TEMP_STEPS, "linear")),
+    ]
+    for name, case in cases:
+        seconds = timeit.timeit(case, number=args.iterations)
+        per_call = seconds / (args.iterations if name == "FanCurve compile" else lookups)
+        print(f"{name:<22} {per_call * 1e9:10.1f} ns/call")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+# IPC load generator and latency benchmark for the fan control daemon
+#   python3 Benchmarks/ipc_bench.py [--clients N] [--duration S] [--mode session|oneshot]
+#                                   [--mix get_temp=70,get_battery_status=10,...]
+#                                   [--socket PATH]   (benchmark an already running daemon)
+#
+# Without --socket a FanControlDaemon is started in-process against a simulated hwmon
+# tree, regular files standing in for /dev/fan1 and /dev/fan2, a fake battery sysfs
+# directory and a FakeGpuBackend, so it runs on any Linux box without Acer hardware
+# or a GPU. Clients run in separate processes so they do not share the daemon's GIL.
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import shutil
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_MIX = "get_temp=60,get_battery_status=10,get_driver_status=10,get_history=10,batch=10"
+
+COMMANDS = {
+    'get_temp': {'type': 'get_temp'},
+    'get_battery_status': {'type': 'get_battery_status'},
+    'get_driver_status': {'type': 'get_driver_status'},
+    'get_control_status': {'type': 'get_control_status'},
+    'get_history': {'type': 'get_history', 'max_points': 300},
+    'batch': {'type': 'batch', 'commands': [
+        {'type': 'get_temp'}, {'type': 'get_battery_status'}, {'type': 'get_driver_status'}
+    ]},
+}
+
+
+def build_fake_tree(root):
+    """Create the simulated hwmon, /dev, /proc/modules and battery sysfs trees under `root`."""
+    def write(path, value):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(f"{value}\n")
+
+    hwmon = os.path.join(root, 'hwmon')
+    write(os.path.join(hwmon, 'hwmon0', 'name'), 'coretemp')
+    write(os.path.join(hwmon, 'hwmon0', 'temp1_label'), 'Package id 0')
+    write(os.path.join(hwmon, 'hwmon0', 'temp1_input'), 55000)
+    write(os.path.join(hwmon, 'hwmon1', 'name'), 'acer')
+    write(os.path.join(hwmon, 'hwmon1', 'fan1_input'), 2400)
+    write(os.path.join(hwmon, 'hwmon1', 'fan2_input'), 2600)
+
+    dev = os.path.join(root, 'dev')
+    write(os.path.join(dev, 'fan1'), '')
+    write(os.path.join(dev, 'fan2'), '')
+
+    battery = os.path.join(root, 'acer-wmi-battery')
+    write(os.path.join(battery, 'health_mode'), 0)
+    write(os.path.join(battery, 'calibration_mode'), 0)
+    write(os.path.join(battery, 'temperature'), 3150)
+
+    proc = os.path.join(root, 'proc')
+    write(os.path.join(proc, 'modules'), "acer_nitro_gaming_driver2 16384 0 - Live 0x0000000000000000\n"
+                                         "acer_wmi_battery 16384 0 - Live 0x0000000000000000")
+    return hwmon, dev, battery, proc
+
+
+def drift_temperatures(hwmon, stop):
+    """Random-walk the simulated CPU temperature so the fan loop has work to do."""
+    path = os.path.join(hwmon, 'hwmon0', 'temp1_input')
+    temp = 55.0
+    while not stop.wait(0.2):
+        temp = min(95.0, max(35.0, temp + random.uniform(-2, 2)))
+        with open(path, 'w') as f:
+            f.write(f"{int(temp * 1000)}\n")
+
+
+def start_daemon(root):
+    import HardwareStatus
+    from DriverManager import DriverManager, ModuleStateCache
+    from DAMFC_daemon2 import FanControlDaemon
+
+    hwmon, dev, battery, proc = build_fake_tree(root)
+    HardwareStatus.set_hwmon_engine(HardwareStatus.HwmonSensorEngine(hwmon))
+    HardwareStatus.set_gpu_backend(HardwareStatus.FakeGpuBackend(60))
+    DriverManager.set_battery_sysfs_path(battery)
+    DriverManager.modules = ModuleStateCache(proc)
+
+    config_path = os.path.join(root, 'config.json')
+    with open(config_path, 'w') as f:
+        json.dump({'battery': {'auto_load_battery_driver': False}}, f)
+
+    daemon = FanControlDaemon(
+        config_path=config_path,
+        socket_path=os.path.join(root, 'daemon.sock'),
+        log_dir=os.path.join(root, 'log'),
+        dev_root=dev
+    )
+    # The benchmark measures IPC, not log I/O
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    daemon.start(load_drivers=False)
+    threading.Thread(target=daemon.handle_socket_commands, daemon=True).start()
+
+    stop = threading.Event()
+    threading.Thread(target=drift_temperatures, args=(hwmon, stop), daemon=True).start()
+
+    deadline = time.monotonic() + 5
+    while not os.path.exists(daemon.socket_path):
+        if time.monotonic() > deadline:
+            raise RuntimeError("Daemon socket did not appear")
+        time.sleep(0.01)
+    return daemon, stop
+
+
+def one_shot(socket_path, command):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(command).encode())
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def run_client(args):
+    """Client process: issue weighted random commands until the deadline."""
+    socket_path, mode, mix, deadline, seed = args
+    from IpcServer import IpcClient
+
+    rng = random.Random(seed)
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    client = IpcClient(socket_path) if mode == 'session' else None
+
+    while time.time() < deadline:
+        name = rng.choices(names, weights)[0]
+        command = dict(COMMANDS[name])
+        start = time.perf_counter()
+        try:
+            if client is not None:
+                client.request(command.pop('type'), **command)
+            else:
+                one_shot(socket_path, command)
+            latencies[name].append(time.perf_counter() - start)
+        except Exception:
+            errors[name] += 1
+
+    if client is not None:
+        client.close()
+    return latencies, errors
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def parse_mix(text):
+    mix = []
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name not in COMMANDS:
+            raise SystemExit(f"Unknown command in mix: {name} (known: {', '.join(COMMANDS)})")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fan control daemon IPC benchmark")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--mode", choices=("session", "oneshot"), default="session")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--socket", help="benchmark a running daemon at this socket path")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    root = None
+    daemon = stop = None
+    socket_path = args.socket
+    if socket_path is None:
+        root = tempfile.mkdtemp(prefix="damfc-bench-")
+        daemon, stop = start_daemon(root)
+        socket_path = daemon.socket_path
+
+    try:
+        deadline = time.time() + args.duration
+        jobs = [(socket_path, args.mode, mix, deadline, seed) for seed in range(args.clients)]
+        started = time.perf_counter()
+        with multiprocessing.get_context("spawn").Pool(args.clients) as pool:
+            results = pool.map(run_client, jobs)
+        elapsed = time.perf_counter() - started
+    finally:
+        if daemon is not None:
+            stop.set()
+            daemon.running = False
+            daemon.sampler.stop()
+            daemon.ipc_server.stop()
+            time.sleep(0.1)
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {'clients': args.clients, 'mode': args.mode, 'duration_s': round(elapsed, 2), 'commands': {}}
+    total = 0
+    for name, _ in mix:
+        values = sorted(v for latencies, _ in results for v in latencies[name])
+        errors = sum(e[name] for _, e in results)
+        total += len(values)
+        report['commands'][name] = {
+            'count': len(values),
+            'errors': errors,
+            'throughput': round(len(values) / elapsed, 1),
+            'p50_ms': round(percentile(values, 50) * 1000, 3),
+            'p95_ms': round(percentile(values, 95) * 1000, 3),
+            'p99_ms': round(percentile(values, 99) * 1000, 3),
+        }
+    report['throughput'] = round(total / elapsed, 1)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{args.clients} {args.mode} clients for {elapsed:.1f} s: {report['throughput']} req/s")
+    print(f"{'command':<22}{'count':>8}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in report['commands'].items():
+        print(f"{name:<22}{r['count']:>8}{r['errors']:>8}{r['throughput']:>10}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# DAMFC_CommandRegistry v0.1.0
+# Table of IPC command handlers with argument validation and per-command metrics
+
+import time
+import logging
+import threading
+from Metrics import LatencyHistogram
+
+NUMBER = (int, float)
+
+
+class CommandError(ValueError):
+    """A command was malformed, unknown or had invalid arguments."""
+
+
+class Command:
+    """A registered command: its handler, declared arguments and call statistics."""
+
+    def __init__(self, name, handler, required=None, optional=None, blocking=False):
+        self.name = name
+        self.handler = handler
+        self.required = required or {}
+        self.optional = optional or {}
+        self.blocking = blocking
+        self.calls = 0
+        self.errors = 0
+        self.latency = LatencyHistogram()
+        self._lock = threading.Lock()
+
+    def arguments(self, command):
+        """Validate `command` against the declared arguments and return them as kwargs."""
+        kwargs = {}
+        for name, types in self.required.items():
+            if name not in command:
+                raise CommandError(f"Missing required argument '{name}' for {self.name}")
+            kwargs[name] = self._check(name, command[name], types)
+        for name, types in self.optional.items():
+            if command.get(name) is not None:
+                kwargs[name] = self._check(name, command[name], types)
+        return kwargs
+
+    def _check(self, name, value, types):
+        # JSON booleans are ints to Python; only accept them where bool is declared
+        if isinstance(value, bool) and not _accepts_bool(types):
+            raise CommandError(f"Argument '{name}' for {self.name} must not be a boolean")
+        if not isinstance(value, types):
+            expected = ", ".join(t.__name__ for t in (types if isinstance(types, tuple) else (types,)))
+            raise CommandError(f"Argument '{name}' for {self.name} must be {expected}, got {type(value).__name__}")
+        return value
+
+    def record(self, seconds, failed):
+        with self._lock:
+            self.calls += 1
+            if failed:
+                self.errors += 1
+            self.latency.record(seconds)
+
+    def metrics(self):
+        with self._lock:
+            return {'calls': self.calls, 'errors': self.errors, 'latency': self.latency.to_dict()}
+
+
+def _accepts_bool(types):
+    return bool in (types if isinstance(types, tuple) else (types,))
+
+
+class CommandRegistry:
+    """Maps command types to handlers; validates arguments once at the IPC edge."""
+
+    def __init__(self):
+        self.commands = {}
+        self.started = time.time()
+
+    def register(self, name, handler, required=None, optional=None, blocking=False):
+        """Register handler(**arguments) for `name`; arguments map names to accepted types."""
+        self.commands[name] = Command(name, handler, required, optional, blocking)
+
+    @property
+    def blocking_commands(self):
+        return tuple(name for name, command in self.commands.items() if command.blocking)
+
+    def dispatch(self, command):
+        if not isinstance(command, dict):
+            raise CommandError("Command must be a JSON object")
+        name = command.get('type')
+        entry = self.commands.get(name)
+        if entry is None:
+            logging.warning(f"Unknown command type: {name}")
+            raise CommandError(f"Unknown command type: {name}")
+
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = entry.handler(**entry.arguments(command))
+            failed = False
+            return result
+        finally:
+            entry.record(time.perf_counter() - start, failed)
+
+    def metrics(self):
+        return {
+            'uptime_s': round(time.time() - self.started, 1),
+            'commands': {name: command.metrics() for name, command in self.commands.items() if command.calls}
+        }
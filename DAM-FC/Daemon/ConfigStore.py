@@ -0,0 +1,133 @@
+# DAMFC_ConfigStore v0.1.0
+# Crash-safe, debounced persistence of the daemon configuration
+
+import os
+import copy
+import json
+import logging
+import threading
+
+DEFAULT_CONFIG = {
+    'min_speed': 640,
+    'max_speed': 2560,
+    'dynamic_mode': True,
+    'temp_steps': [
+        {'temperature': 50, 'speed': 1024},
+        {'temperature': 70, 'speed': 1536},
+        {'temperature': 80, 'speed': 2048}
+    ],
+    'battery': {
+        'health_mode': False,
+        'calibration_mode': False,
+        'auto_load_battery_driver': True
+    }
+}
+
+
+class ConfigStore:
+    """
+    Saves the configuration as JSON through a temp file, fsync and rename, so the file
+    on disk is always either the old or the new version. Saves within `delay` seconds
+    of the first pending one are coalesced into a single write. The version replaced
+    by each write is kept as <path>.bak and used when the main file cannot be read.
+    """
+
+    def __init__(self, path, delay=0.5):
+        self.path = path
+        self.backup_path = path + ".bak"
+        self.delay = delay
+        self.writes = 0
+        self.coalesced = 0
+        self._pending = None  # Serialized config waiting to be written
+        self._path_valid = False  # Whether the main file holds a config we could read or wrote
+        self._timer = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def load(self):
+        """Return the stored config, the backup if the file is damaged, or the defaults."""
+        logging.info(f"Attempting to load configuration from {self.path}")
+        for path in (self.path, self.backup_path):
+            try:
+                with open(path, 'r') as f:
+                    config = json.load(f)
+                if not isinstance(config, dict):
+                    raise ValueError("top level is not an object")
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError) as e:
+                logging.error(f"Error reading configuration file {path}: {e}")
+                continue
+            if path == self.backup_path:
+                logging.warning(f"Using last known good configuration from {path}")
+            else:
+                self._path_valid = True
+                logging.info("Configuration loaded successfully")
+            return config
+
+        logging.warning("No usable configuration file found. Using default settings.")
+        return copy.deepcopy(DEFAULT_CONFIG)
+
+    def save(self, config):
+        """Schedule `config` to be written; it is serialized now, so later edits need another save()."""
+        data = json.dumps(config, indent=4)
+        with self._lock:
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = data
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write the pending config now, if there is one (also called on shutdown)."""
+        # Taking and writing happen under one lock, so an older config cannot be
+        # written after a newer one taken by a concurrent flush
+        with self._write_lock:
+            with self._lock:
+                data = self._pending
+                self._pending = None
+                if self._timer is not None and self._timer is not threading.current_thread():
+                    self._timer.cancel()
+                self._timer = None
+            if data is None:
+                return True
+            return self._write(data)
+
+    def _write(self, data):
+        directory = os.path.dirname(self.path) or "."
+        temp_path = self.path + ".tmp"
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(temp_path, 'w') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+            # Keep the version being replaced as last known good (unless it is the damaged
+            # file we could not load), without ever leaving the main path missing
+            if self._path_valid and os.path.exists(self.path):
+                backup_temp = self.backup_path + ".tmp"
+                if os.path.exists(backup_temp):
+                    os.remove(backup_temp)
+                os.link(self.path, backup_temp)
+                os.replace(backup_temp, self.backup_path)
+            os.replace(temp_path, self.path)
+            self._path_valid = True
+
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+            self.writes += 1
+            logging.info("Configuration saved successfully")
+            return True
+        except OSError as e:
+            logging.error(f"Failed to save configuration: {e}")
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {'writes': self.writes, 'coalesced': self.coalesced, 'pending': self._pending is not None}
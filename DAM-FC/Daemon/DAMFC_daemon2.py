@@ -1,40 +1,89 @@
 # DAMFC_Daemon v0.9.1 
 
 import os
-import json
 import time
 import logging
 import threading
-import socket
-import json
 import signal
 import sys
 from DriverManager import DriverManager
 import HardwareStatus
+from IpcServer import IpcServer
+from JobRunner import JobRunner
+from CommandRegistry import CommandRegistry, CommandError, NUMBER
+from ConfigStore import ConfigStore
+from DaemonConfig import DaemonConfig, ConfigError, ControlState
+from TelemetryHistory import TelemetryHistory
+from FanControl import FanActuator, FanChannel
 
 class FanControlDaemon:
-    def __init__(self, config_path='/var/lib/acer_fan_control/config.json'):
+    def __init__(self, config_path='/var/lib/acer_fan_control/config.json',
+                 socket_path='/var/run/fan_control_daemon.sock',
+                 log_dir='/var/log/acer_fan_control', dev_root='/dev'):
+        self.started_at = time.time()
+        
         # Setup logging with more detailed output
-        self.setup_logging()
+        self.setup_logging(log_dir)
         
         logging.info("Initializing Fan Control Daemon")
         logging.info(f"Config path: {config_path}")
         
         self.config_path = config_path
-        self.config = self.load_config()
+        self.socket_path = socket_path
+        self.ipc_server = None
+        self.config_store = ConfigStore(config_path)
+        
+        # Config and dynamic mode are published together as one immutable ControlState.
+        # Writers serialize on _state_lock and swap the reference; readers never lock.
+        # Fan writes take the lock too, so no curve write lands after a mode change.
+        config = self.load_config()
+        self.state = ControlState(config, config.dynamic_mode)
+        self._state_lock = threading.Lock()
         self.running = False
+        self.sampler = HardwareStatus.HardwareSampler(
+            self.sample_hardware, self.config.sample_interval
+        )
+        
+        # Fixed-size telemetry history fed by every new snapshot
+        self.history = TelemetryHistory()
+        self.fan_targets = {1: None, 2: None}
+        
+        # Persistent /dev/fanN handles with change-only writes
+        self.actuator = FanActuator(dev_root)
+        self.sampler.listeners.append(self.record_history)
+        self.sampler.listeners.append(self.publish_snapshot)
+        self.subscriber_interval = None
+        
+        # Fan driver builds and (re)loads run as background jobs, one at a time
+        self.jobs = JobRunner()
         
-        # Initialize dynamic mode from config
-        self.dynamicModeEnabled = self.config.get('dynamic_mode', True)
+        # State shared by the commands of one batch (per handler thread)
+        self._batch = threading.local()
+        
+        # Background initializers run by start(), by name, and when the socket came up
+        self.startup_jobs = {}
+        self.socket_ready_at = None
+        self.warm_start = None  # Whether the fan driver initializer reused the loaded driver
+        
+        # IPC command table with per-command call, error and latency metrics
+        self.commands = CommandRegistry()
+        self.register_commands()
+        
+        # Independent control channel per fan (1 = CPU, 2 = GPU), each with its own
+        # compiled curve and adaptive poll interval; set fan_wakeup to re-evaluate now
+        self.channels = {1: FanChannel(1), 2: FanChannel(2)}
+        self.applied_config = None  # Config the channels were last configured from
+        self.configure_channels(self.config)
+        self.fan_wakeup = threading.Event()
         logging.info(f"Dynamic mode initialized to: {self.dynamicModeEnabled}")
     
-        # Setup signal handlers for graceful shutdown
+        # Setup signal handlers for graceful shutdown; while the socket is served
+        # the event loop takes these signals over (see handle_socket_commands)
         signal.signal(signal.SIGINT, self.shutdown)
         signal.signal(signal.SIGTERM, self.shutdown)
 
-    def setup_logging(self):
+    def setup_logging(self, log_dir):
         # Ensure log directory exists
-        log_dir = '/var/log/acer_fan_control'
         os.makedirs(log_dir, exist_ok=True)
         
         # Configure logging with more detailed format
@@ -52,94 +101,178 @@ class FanControlDaemon:
         
         logging.info("Logging system initialized")
 
+    @property
+    def config(self):
+        return self.state.config
+
+    @property
+    def dynamicModeEnabled(self):
+        return self.state.dynamic_mode
+
+    def update_state(self, change, save=False):
+        """Publish change(current state) as the new ControlState; wake the fan loop if it enables dynamic mode."""
+        with self._state_lock:
+            previous = self.state
+            self.state = change(previous)
+            if save:
+                self.save_config()
+        # A config change alone waits for the next scheduled tick, so an immediate one
+        # cannot overwrite the manual speeds the GUI sets right after update_config
+        if self.state.dynamic_mode and not previous.dynamic_mode:
+            self.fan_wakeup.set()
+        return self.state
+
     def load_config(self):
-        logging.info(f"Attempting to load configuration from {self.config_path}")
         try:
-            with open(self.config_path, 'r') as f:
-                config = json.load(f)
-                logging.info("Configuration loaded successfully")
-                return config
-        except FileNotFoundError:
-            logging.warning("No configuration file found. Using default settings.")
-            return {
-                'min_speed': 640,
-                'max_speed': 2560,
-                'dynamic_mode': True,
-                'temp_steps': [
-                    {'temperature': 50, 'speed': 1024},
-                    {'temperature': 70, 'speed': 1536},
-                    {'temperature': 80, 'speed': 2048}
-                ],
-                'battery': {
-                    'health_mode': False,
-                    'calibration_mode': False,
-                    'auto_load_battery_driver': True
-                }
-            }
-        except json.JSONDecodeError:
-            logging.error("Error decoding configuration file. Using default settings.")
-            return {
-                'min_speed': 640,
-                'max_speed': 2560,
-                'dynamic_mode': True,
-                'temp_steps': [
-                    {'temperature': 50, 'speed': 1024},
-                    {'temperature': 70, 'speed': 1536},
-                    {'temperature': 80, 'speed': 2048}
-                ],
-                'battery': {
-                    'health_mode': False,
-                    'calibration_mode': False,
-                    'auto_load_battery_driver': True
-                }
-            }
+            return DaemonConfig.from_dict(self.config_store.load())
+        except ConfigError as e:
+            logging.error(f"Invalid configuration, using default settings: {e}")
+            return DaemonConfig.defaults()
 
     def save_config(self):
-        logging.info("Saving current configuration")
+        """Queue the current configuration for a debounced, atomic write."""
         try:
-            os.makedirs(os.path.dirname(self.config_path), exist_ok=True)
-            with open(self.config_path, 'w') as f:
-                json.dump(self.config, f, indent=4)
-            logging.info("Configuration saved successfully")
+            self.config_store.save(self.config.to_dict())
         except Exception as e:
             logging.error(f"Failed to save configuration: {e}")
 
-    def get_cpu_temp(self):
+    def sample_hardware(self):
+        """Capture every sensor in one pass; called by the hardware sampler."""
         try:
-            return int(HardwareStatus.get_cpu_temp())
-            
+            return HardwareStatus.take_snapshot(DriverManager.battery.temperature)
         except Exception as e:
-            logging.error(f"Error reading CPU temperature: {e}")
-            return 0
+            logging.error(f"Error sampling hardware sensors: {e}")
+            return HardwareStatus.HardwareSnapshot()
+
+    def configure_channels(self, config):
+        """Apply the global and per-fan ('fans') configuration to the control channels."""
+        for fan_number, channel in self.channels.items():
+            fan = config.fans[fan_number]
+            channel.configure(fan.source, fan.coupling, fan.build_controller(config.min_speed, config.max_speed))
+            channel.scheduler.configure(config.poll_min, config.poll_max)
+        self.applied_config = config
+
+    def record_history(self, snapshot):
+        self.history.record(snapshot.timestamp, {
+            'cpu_temp': snapshot.cpu_temp,
+            'gpu_temp': snapshot.gpu_temp,
+            'cpu_fan_target': self.fan_targets[1],
+            'gpu_fan_target': self.fan_targets[2],
+            'cpu_fan_rpm': snapshot.cpu_fan_rpm,
+            'gpu_fan_rpm': snapshot.gpu_fan_rpm
+        })
 
-    def get_gpu_temp(self):
+    def reload_drivers(self):
+        # Open fan handles pin the module, release them before rmmod
+        self.actuator.suspend()
         try:
-            temp = HardwareStatus.get_gpu_temp()
-            if isinstance(temp, str):  # Check if it's a string (like "N/A")
-                return 0  # Return a safe default value
-            return int(temp)
-        except Exception as e:
-            logging.error(f"Could not read GPU temperature: {e}")
-            return 0 
+            DriverManager.remove_driver()
+            DriverManager.remove_fan_control_files()
+            return DriverManager.ensure_driver_loaded()
+        finally:
+            self.actuator.resume()
+
+    def unload_drivers(self):
+        self.actuator.suspend()
+        removed = DriverManager.remove_driver()
+        if not removed:
+            # The driver is still loaded, so keep controlling the fans through it
+            self.actuator.resume()
+        return removed
+
+    def load_drivers(self):
+        success = DriverManager.load_driver()
+        self.actuator.resume()
+        return success
+
+    # IPC command -> method running the fan driver operation
+    DRIVER_JOBS = {
+        'compile_drivers': lambda self: DriverManager.compile_driver(),
+        'clean_compiled_drivers': lambda self: DriverManager.clean_compiled_drivers(),
+        'reload_complied_drivers': reload_drivers,
+        'unload_drivers': unload_drivers,
+        'load_drivers': load_drivers,
+    }
+
+    def submit_driver_job(self, kind):
+        """Queue a fan driver operation; all of them share one worker so they never overlap."""
+        operation = self.DRIVER_JOBS[kind]
+
+        def run(job):
+            with DriverManager.streaming_output(job.log):
+                return operation(self)
 
-    def set_fan_speed(self, fan_number, speed):
+        return self.jobs.submit(kind, run, group='fan_driver').id
+
+    def get_snapshot(self, max_age=None):
+        """Latest sensor snapshot; every command of a batch sees the same one."""
+        snapshot = getattr(self._batch, 'snapshot', None)
+        if snapshot is None:
+            snapshot = self.sampler.get(max_age)
+            if getattr(self._batch, 'active', False):
+                self._batch.snapshot = snapshot
+        return snapshot
+
+    def execute_batch(self, commands):
+        """Run commands in order with shared caches; one result or error entry per command."""
+        if not isinstance(commands, list):
+            raise CommandError("'commands' must be a list")
+        if getattr(self._batch, 'active', False):
+            raise CommandError("Nested batch commands are not supported")
+
+        results = []
+        self._batch.active = True
+        self._batch.snapshot = None
+        try:
+            for command in commands:
+                try:
+                    if isinstance(command, dict) and command.get('type') == 'batch':
+                        raise CommandError("Nested batch commands are not supported")
+                    results.append({'ok': True, 'result': self.execute_command(command)})
+                except KeyError as e:
+                    results.append({'ok': False, 'error': f"Missing key in command: {e}"})
+                except Exception as e:
+                    results.append({'ok': False, 'error': str(e)})
+        finally:
+            self._batch.active = False
+            self._batch.snapshot = None
+        return results
+
+    def publish_snapshot(self, snapshot):
+        if self.ipc_server is not None:
+            self.ipc_server.publish(snapshot.to_dict())
+
+    def set_subscriber_interval(self, interval):
+        self.subscriber_interval = interval
+        self.apply_sample_interval()
+
+    def apply_sample_interval(self):
+        """Sample at the configured rate, or faster while a subscriber asked for it."""
+        interval = self.config.sample_interval
+        if self.subscriber_interval is not None:
+            interval = min(interval, max(self.subscriber_interval, 0.1))
+        self.sampler.interval = interval
+
+    def set_fan_speed(self, fan_number, speed, config=None):
+        """Clamp `speed` to the bounds of `config` (default: the current one) and write it."""
         try:
             if 0 < int(fan_number) < 3:
-                fan_file = f'/dev/fan{fan_number}'
+                fan_number = int(fan_number)
                 # logging.info(f"Attempting to set Fan {fan_number} speed to {speed}")
                 
                 # Validate speed is within acceptable range
-                if speed < self.config.get('min_speed', 640):
-                    speed = self.config.get('min_speed', 640)
+                config = config or self.config
+                if speed < config.min_speed:
+                    speed = config.min_speed
                     logging.warning(f"Speed adjusted to minimum: {speed}")
                 
-                if speed > self.config.get('max_speed', 2560):
-                    speed = self.config.get('max_speed', 2560)
+                if speed > config.max_speed:
+                    speed = config.max_speed
                     logging.warning(f"Speed adjusted to maximum: {speed}")
                 
-                with open(fan_file, 'w') as f:
-                    os.system(f"sudo echo {speed} | tee /dev/fan{fan_number}")
-                logging.info(f"Successfully set Fan {fan_number} to speed {speed}")
+                if self.actuator.write(fan_number, speed):
+                    logging.info(f"Successfully set Fan {fan_number} to speed {speed}")
+                self.fan_targets[fan_number] = speed
             else:
                 logging.error(f"Invalid fan number: {fan_number}")
         except PermissionError:
@@ -153,187 +286,274 @@ class FanControlDaemon:
 
         logging.info("Starting dynamic fan control thread")
         while self.running:
-            if self.dynamicModeEnabled == True:
+            # One reference per tick: the whole tick sees a single config and mode
+            state = self.state
+            if state.config is not self.applied_config:
+                # The channels belong to this thread, so they are reconfigured here
+                self.configure_channels(state.config)
+            now = time.monotonic()
+            if state.dynamic_mode:
                 # try:
-                cpu_temp = self.get_cpu_temp()
-                gpu_temp = self.get_gpu_temp()
-
-                logging.debug(f"Current temperatures - CPU: {cpu_temp}°C, GPU: {gpu_temp}°C")
+                due = [channel for channel in self.channels.values() if channel.next_due <= now]
+                if due:
+                    snapshot = self.sampler.get(max_age=min(channel.scheduler.interval for channel in due))
+                    logging.debug(f"Current temperatures - CPU: {snapshot.cpu_temp}°C, GPU: {snapshot.gpu_temp}°C")
 
-                # Dynamic fan speed logic
-                max_temp = max(cpu_temp, gpu_temp)
-                
-                for step in sorted(self.config.get('temp_steps', []), key=lambda x: x['temperature'], reverse=True):
-                    if max_temp >= step['temperature']:
-                        logging.info(f"Setting fans to {step['speed']} due to temperature {max_temp}°C")
-                        self.set_fan_speed(1, step['speed'])  # CPU Fan
-                        self.set_fan_speed(2, step['speed'])  # GPU Fan
-                        break
+                    # Each fan follows its own sensor and curve
+                    for channel in due:
+                        speed = channel.evaluate(snapshot, now)
+                        if speed is None:
+                            continue
+                        with self._state_lock:
+                            # Dynamic mode may have been switched off (or the config
+                            # replaced) since this tick read the state
+                            if self.state is not state:
+                                break
+                            logging.debug(f"Setting fan {channel.fan_number} to {speed} due to temperature {channel.input_temp}°C")
+                            self.set_fan_speed(channel.fan_number, speed, state.config)
 
                 # except Exception as e:
                 #     logging.error(f"Error in dynamic fan control: {e}")
 
-                time.sleep(5)  # Check every 5 seconds
+                interval = max(0.0, min(channel.next_due for channel in self.channels.values()) - time.monotonic())
+            else:
+                interval = min(channel.idle() for channel in self.channels.values())
+
+            # Poll faster while temperatures move, back off while they are stable
+            self.fan_wakeup.wait(interval)
+            self.fan_wakeup.clear()
         
         logging.info("Dynamic fan control thread stopped")
 
-    def start(self):
+    def start(self, load_drivers=True):
+        """Launch the initializers in the background; the socket can be served right away."""
         logging.info("Starting Fan Control Daemon")
         self.running = True
         
-        # Start dynamic fan control in a separate thread
-        fan_thread = threading.Thread(target=self.dynamic_fan_control)
-        fan_thread.daemon = True  # Allow thread to be killed when main process exits
-        fan_thread.start()
-        
+        # Each initializer has its own job group, so they run in parallel. The fan driver
+        # shares its group with the driver commands, which therefore wait for it.
+        self.submit_startup_job('sensors', self.init_sensors, 'sensors')
+        if load_drivers:
+            self.submit_startup_job('fan_driver', self.init_fan_driver, 'fan_driver')
+        else:
+            self.start_fan_control()
+        self.submit_startup_job('battery', self.init_battery, 'battery_driver')
+
+    def submit_startup_job(self, name, initializer, group):
+        def run(job):
+            with DriverManager.streaming_output(job.log):
+                return initializer()
+
+        self.startup_jobs[name] = self.jobs.submit(f"startup_{name}", run, group=group)
+
+    def init_sensors(self):
+        # Discover sensors once so the fan loop reuses persistent handles
+        HardwareStatus.get_hwmon_engine()
+        HardwareStatus.get_gpu_backend()
+        self.sampler.start()
+        return True
+
+    def init_fan_driver(self):
+        try:
+            # A daemon restart finds the driver it loaded itself still running: keep it
+            self.warm_start = DriverManager.can_warm_start(self.actuator.dev_root)
+            if self.warm_start:
+                logging.info("Fan driver and device nodes are current, skipping driver setup")
+                return True
+            if DriverManager.is_driver_loaded():
+                # Loaded, but an older build or without valid device nodes. Open fan
+                # handles pin the module, release them before rmmod
+                self.actuator.suspend()
+                try:
+                    removed = DriverManager.remove_driver()
+                finally:
+                    self.actuator.resume()
+                if not removed:
+                    # Its device nodes still belong to it, so leave them in place
+                    logging.warning("Could not remove the outdated fan driver, keeping it loaded")
+                    return True
+            DriverManager.remove_fan_control_files()
+            return DriverManager.ensure_driver_loaded()
+        finally:
+            # Only start writing once the driver had its chance to create /dev/fanN
+            self.start_fan_control()
+
+    def init_battery(self):
         # Load battery driver if configured
-        if self.config.get('battery', {}).get('auto_load_battery_driver', True):
+        if self.config.auto_load_battery_driver:
             self.ensure_battery_driver_loaded()
         
         # Apply saved battery settings
         self.apply_saved_battery_settings()
-        
-        logging.info("Daemon started successfully")
+        return True
+
+    def start_fan_control(self):
+        # Start dynamic fan control in a separate thread
+        fan_thread = threading.Thread(target=self.dynamic_fan_control)
+        fan_thread.daemon = True  # Allow thread to be killed when main process exits
+        fan_thread.start()
+
+    def socket_listening(self):
+        self.socket_ready_at = time.time()
+        logging.info(f"Socket ready {(self.socket_ready_at - self.started_at) * 1000:.0f} ms after start")
+
+    def startup_report(self):
+        """Per-phase start offsets and durations in ms, relative to daemon construction."""
+        def offset(timestamp):
+            return None if timestamp is None else round((timestamp - self.started_at) * 1000, 1)
+
+        phases = {}
+        for name, job in self.startup_jobs.items():
+            duration = None
+            if job.started is not None and job.finished is not None:
+                duration = round((job.finished - job.started) * 1000, 1)
+            phases[name] = {
+                'state': job.state,
+                'start_ms': offset(job.started),
+                'duration_ms': duration,
+                'error': job.error
+            }
+        finished = [job.finished for job in self.startup_jobs.values()]
+        return {
+            'started_at': self.started_at,
+            'socket_ready_ms': offset(self.socket_ready_at),
+            'warm_start': self.warm_start,
+            'ready_ms': offset(max(finished)) if finished and None not in finished else None,
+            'phases': phases
+        }
 
     def shutdown(self, signum=None, frame=None):
+        """Signal handler: stop serving; cleanup() runs once handle_socket_commands() returns."""
         logging.info(f"Received shutdown signal {signum}. Stopping daemon.")
         self.running = False
-        # Additional cleanup can be added here
-        sys.exit(0)
+        if self.ipc_server is not None:
+            self.ipc_server.stop()
+
+    def cleanup(self):
+        logging.info("Stopping daemon")
+        self.running = False
+        self.fan_wakeup.set()
+        self.sampler.stop()
+        self.actuator.close()
+        self.config_store.flush()
+        # Release the persistent sensor handles
+        HardwareStatus.set_gpu_backend(None)
+        HardwareStatus.set_hwmon_engine(None)
 
     def handle_socket_commands(self):
-        # Unix domain socket for IPC with C# GUI
-        socket_path = '/var/run/fan_control_daemon.sock'
+        """Serve the socket until SIGINT/SIGTERM (or ipc_server.stop())."""
+        # Unix domain socket for IPC with C# GUI; serves clients concurrently
+        main_thread = threading.current_thread() is threading.main_thread()
+        self.ipc_server = IpcServer(
+            self.execute_command, self.socket_path, self.commands.blocking_commands,
+            on_subscriptions_changed=self.set_subscriber_interval,
+            on_listening=self.socket_listening,
+            stop_signals=(signal.SIGINT, signal.SIGTERM) if main_thread else ()
+        )
+        if not self.running:
+            return  # Shutdown signal arrived during startup
+        self.ipc_server.run()
+    
+    def execute_command(self, command):
+        """Run a command and return its response; raises on invalid commands."""
+        logging.debug(f"Processing command: {command}")
+        return self.commands.dispatch(command)
 
-        logging.info(f"Preparing Unix socket at {socket_path}")
+    def register_commands(self):
+        """Declare every IPC command with its handler and argument types."""
+        register = self.commands.register
+        register('set_fan_speed', self.cmd_set_fan_speed, required={'fan': int, 'speed': int})
+        register('update_config', self.cmd_update_config, required={'config': dict})
+        register('get_temp', self.cmd_get_temp, optional={'max_age_ms': NUMBER})
+        register('batch', self.cmd_batch, required={'commands': list})
+        register('get_history', self.cmd_get_history,
+                 optional={'start': NUMBER, 'end': NUMBER, 'resolution': int, 'max_points': int})
+        register('set_dynamic_mode', self.cmd_set_dynamic_mode, required={'toActivate': bool})
+        register('get_control_status', self.cmd_get_control_status)
+        register('get_metrics', self.cmd_get_metrics)
+        register('get_startup_report', self.startup_report)
+        register('get_driver_status', DriverManager.get_driver_status)
+        for kind in self.DRIVER_JOBS:
+            register(kind, lambda kind=kind: {'job_id': self.submit_driver_job(kind)})
+        register('get_job', self.cmd_get_job, required={'job_id': int}, optional={'tail': int})
+        
+        # Battery control commands - now delegated to DriverManager
+        register('get_battery_status', DriverManager.get_battery_status)
+        register('set_battery_health_mode', self.cmd_set_battery_health_mode, required={'enabled': bool})
+        register('set_battery_calibration_mode', self.cmd_set_battery_calibration_mode, required={'enabled': bool})
+        register('load_battery_driver', lambda: {'success': DriverManager.load_battery_driver()}, blocking=True)
+        register('unload_battery_driver', lambda: {'success': DriverManager.unload_battery_driver()}, blocking=True)
+        register('set_auto_load_battery_driver', self.cmd_set_auto_load_battery_driver, required={'enabled': bool})
 
-        if os.path.exists(socket_path):
-            os.unlink(socket_path)
+    def cmd_set_fan_speed(self, fan, speed):
+        # Under the state lock so it is ordered against the fan loop's writes
+        with self._state_lock:
+            self.set_fan_speed(fan, speed)
 
-        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        sock.bind(socket_path)
+    def cmd_update_config(self, config):
+        """
+        Replace the top-level keys present in `config` and keep every other key of the
+        current config. The GUI sends only min/max speed, dynamic_mode and temp_steps, so
+        battery, fans, controller, curve_mode and the poll/sample intervals survive it.
+        """
+        logging.info("Updating configuration")
 
-        # Set socket permissions to allow non-root access if needed
-        os.chmod(socket_path, 0o666)
+        def change(state):
+            data = dict(state.config.to_dict(), **config)
+            return state.replace(config=DaemonConfig.from_dict(data))
 
-        sock.listen(1)
-        logging.info("Socket listening for connections")
+        self.update_state(change, save=True)
+        self.apply_sample_interval()
 
-        while self.running:
-            try:
-                connection, client_address = sock.accept()
-                logging.info(f"Connection from {client_address}")
+    def cmd_get_temp(self, max_age_ms=None):
+        snapshot = self.get_snapshot(None if max_age_ms is None else max_age_ms / 1000)
+        response = snapshot.to_dict()
+        response['age_ms'] = int(self.sampler.age(snapshot) * 1000)
+        return response
 
-                try:
-                    data = connection.recv(1024)
-                    if data:
-                        command = json.loads(data.decode())
-                        # logging.info(f"Received command: {command}")
-                        response = self.process_command(command)
-
-                        # Send response back if there is one
-                        if response:
-                            connection.sendall(json.dumps(response).encode())
-                except json.JSONDecodeError:
-                    logging.error("Invalid JSON received")
-                except Exception as e:
-                    logging.error(f"Error processing socket command: {e}")
-                finally:
-                    connection.close()
-            except Exception as e:
-                logging.error(f"Socket connection error: {e}")
-                time.sleep(1)  # Prevent tight error loop
-    
-    def process_command(self, command):
-        logging.info(f"Processing command: {command}")
-        
-        try:
-            if command['type'] == 'set_fan_speed':
-                self.set_fan_speed(command['fan'], command['speed'])
+    def cmd_batch(self, commands):
+        return {'results': self.execute_batch(commands)}
 
-            elif command['type'] == 'update_config':
-                logging.info("Updating configuration")
-                self.config = command['config']
-                self.save_config()
+    def cmd_get_history(self, start=None, end=None, resolution=None, max_points=1000):
+        return self.history.query(start, end, resolution, max_points)
 
-            elif command['type'] == 'get_temp':
-                return {
-                    'cpu_temp': self.get_cpu_temp(),
-                    'gpu_temp': self.get_gpu_temp()
-                }
-            
-            elif command['type'] == 'set_dynamic_mode':
-                self.dynamicModeEnabled = command['toActivate']
-                logging.info(f"Dynamic mode set to: {self.dynamicModeEnabled}")
-                   
-            elif command['type'] == 'get_driver_status':
-                return DriverManager.get_driver_status()
-            
-            elif command['type'] == 'clean_compiled_drivers':
-                DriverManager.clean_compiled_drivers()
-            
-            elif command['type'] == 'reload_complied_drivers':
-                DriverManager.remove_driver()
-                DriverManager.remove_fan_control_files()
-                DriverManager.ensure_driver_loaded()
-
-            elif command['type'] == 'unload_drivers':
-                DriverManager.remove_driver()
-            
-            elif command['type'] == 'compile_drivers':
-                DriverManager.compile_driver()
-                
-            elif command['type'] == 'load_drivers':
-                DriverManager.load_driver()
-                
-            # Battery control commands - now delegated to DriverManager
-            elif command['type'] == 'get_battery_status':
-                return {
-                    'health_mode': DriverManager.get_battery_health_mode(),
-                    'calibration_mode': DriverManager.get_battery_calibration_mode(),
-                    'temperature': DriverManager.get_battery_temperature(),
-                    'driver_loaded': DriverManager.is_battery_driver_loaded()
-                }
-                
-            elif command['type'] == 'set_battery_health_mode':
-                success = DriverManager.set_battery_health_mode(command['enabled'])
-                # Update config to save this setting
-                if 'battery' not in self.config:
-                    self.config['battery'] = {}
-                self.config['battery']['health_mode'] = command['enabled']
-                self.save_config()
-                return {'success': success}
-                
-            elif command['type'] == 'set_battery_calibration_mode':
-                success = DriverManager.set_battery_calibration_mode(command['enabled'])
-                # Update config to save this setting
-                if 'battery' not in self.config:
-                    self.config['battery'] = {}
-                self.config['battery']['calibration_mode'] = command['enabled']
-                self.save_config()
-                return {'success': success}
-                
-            elif command['type'] == 'load_battery_driver':
-                success = DriverManager.load_battery_driver()
-                return {'success': success}
-                
-            elif command['type'] == 'unload_battery_driver':
-                success = DriverManager.unload_battery_driver()
-                return {'success': success}
-                
-            elif command['type'] == 'set_auto_load_battery_driver':
-                if 'battery' not in self.config:
-                    self.config['battery'] = {}
-                self.config['battery']['auto_load_battery_driver'] = command['enabled']
-                self.save_config()
-            
-            else:
-                logging.warning(f"Unknown command type: {command['type']}")
-        
-        except KeyError as e:
-            logging.error(f"Missing key in command: {e}")
-        except Exception as e:
-            logging.error(f"Error processing command: {e}")
+    def cmd_set_dynamic_mode(self, toActivate):
+        self.update_state(lambda state: state.replace(dynamic_mode=toActivate))
+        logging.info(f"Dynamic mode set to: {toActivate}")
+
+    def cmd_get_control_status(self):
+        return {
+            'dynamic_mode': self.state.dynamic_mode,
+            'fans': {fan_number: channel.status() for fan_number, channel in self.channels.items()},
+            'actuator': self.actuator.stats()
+        }
+
+    def cmd_get_metrics(self):
+        metrics = self.commands.metrics()
+        metrics['config_store'] = self.config_store.stats()
+        return metrics
+
+    def cmd_get_job(self, job_id, tail=50):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise CommandError(f"Unknown job: {job_id}")
+        return job.to_dict(tail)
+
+    def cmd_set_battery_health_mode(self, enabled):
+        success = DriverManager.set_battery_health_mode(enabled)
+        # Update config to save this setting
+        self.update_state(lambda state: state.replace(config=state.config.with_battery(health_mode=enabled)), save=True)
+        return {'success': success}
+
+    def cmd_set_battery_calibration_mode(self, enabled):
+        success = DriverManager.set_battery_calibration_mode(enabled)
+        # Update config to save this setting
+        self.update_state(lambda state: state.replace(config=state.config.with_battery(calibration_mode=enabled)), save=True)
+        return {'success': success}
+
+    def cmd_set_auto_load_battery_driver(self, enabled):
+        self.update_state(lambda state: state.replace(config=state.config.with_battery(auto_load_battery_driver=enabled)),
+                          save=True)
 
     # Helper methods for battery management that use DriverManager
     def ensure_battery_driver_loaded(self):
@@ -346,21 +566,15 @@ class FanControlDaemon:
             logging.warning("Cannot apply battery settings: Driver not loaded")
             return
         
-        # Get battery settings from config
-        battery_config = self.config.get('battery', {})
-        
         # Apply settings using DriverManager
-        health_mode = battery_config.get('health_mode')
-        calibration_mode = battery_config.get('calibration_mode')
-        
-        DriverManager.apply_battery_settings(health_mode, calibration_mode)
+        DriverManager.apply_battery_settings(self.config.health_mode, self.config.calibration_mode)
 
 def main():
     daemon = FanControlDaemon()
-    DriverManager.remove_fan_control_files()
-    DriverManager.ensure_driver_loaded()
     daemon.start()
     daemon.handle_socket_commands()
+    daemon.cleanup()
+    sys.exit(0)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,184 @@
+# DAMFC_DaemonConfig v0.1.0
+# Validated, immutable view of the daemon configuration
+
+import copy
+from ConfigStore import DEFAULT_CONFIG
+from FanControl import FanChannel, FanCurve, build_controller
+
+
+class ConfigError(ValueError):
+    """The configuration is malformed or has out-of-range values."""
+
+
+def _number(data, key, default, minimum=None, maximum=None, integer=False):
+    value = data.get(key, default)
+    types = int if integer else (int, float)
+    # JSON booleans are ints to Python
+    if isinstance(value, bool) or not isinstance(value, types):
+        raise ConfigError(f"'{key}' must be {'an integer' if integer else 'a number'}, got {value!r}")
+    if minimum is not None and value < minimum:
+        raise ConfigError(f"'{key}' must be at least {minimum}, got {value}")
+    if maximum is not None and value > maximum:
+        raise ConfigError(f"'{key}' must be at most {maximum}, got {value}")
+    return value
+
+
+def _flag(data, key, default):
+    value = data.get(key, default)
+    if not isinstance(value, bool):
+        raise ConfigError(f"'{key}' must be true or false, got {value!r}")
+    return value
+
+
+def _section(data, key):
+    value = data.get(key, {})
+    if not isinstance(value, dict):
+        raise ConfigError(f"'{key}' must be an object, got {value!r}")
+    return value
+
+
+def _temp_steps(steps, where):
+    if not isinstance(steps, list):
+        raise ConfigError(f"'temp_steps' {where}must be a list")
+    for index, step in enumerate(steps):
+        if not isinstance(step, dict):
+            raise ConfigError(f"temp_steps[{index}] {where}must be an object")
+        for key in ('temperature', 'speed'):
+            if key not in step:
+                raise ConfigError(f"temp_steps[{index}] {where}is missing '{key}'")
+        _number(step, 'temperature', None, 0, FanCurve.MAX_TEMP)
+        _number(step, 'speed', None, 0, integer=True)
+    return steps
+
+
+class FanConfig:
+    """Settings of one fan channel, with its curve compiled."""
+    __slots__ = ("fan_number", "source", "coupling", "curve", "controller")
+
+    def __init__(self, fan_number, source, coupling, curve, controller):
+        object.__setattr__(self, "fan_number", fan_number)
+        object.__setattr__(self, "source", source)
+        object.__setattr__(self, "coupling", coupling)
+        object.__setattr__(self, "curve", curve)
+        object.__setattr__(self, "controller", controller)  # Spec for build_controller()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"FanConfig is immutable (tried to set {name})")
+
+    def build_controller(self, min_speed, max_speed):
+        """A fresh controller for this fan; controllers keep state, so one per apply."""
+        return build_controller(self.controller, self.curve, min_speed, max_speed)
+
+
+class DaemonConfig:
+    """
+    The configuration checked once and turned into plain attributes: speed bounds,
+    poll and sample intervals in seconds, battery flags and a FanConfig per fan.
+    Instances never change; an update builds a new one from a dict with from_dict().
+    """
+    __slots__ = ("min_speed", "max_speed", "dynamic_mode", "sample_interval", "poll_min", "poll_max",
+                 "fans", "health_mode", "calibration_mode", "auto_load_battery_driver", "_data")
+
+    FAN_NUMBERS = (1, 2)
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"DaemonConfig is immutable (tried to set {name})")
+
+    @classmethod
+    def defaults(cls):
+        return cls.from_dict(DEFAULT_CONFIG)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Validate a config dict (as stored or sent by the GUI); raises ConfigError."""
+        if not isinstance(data, dict):
+            raise ConfigError("Configuration must be an object")
+        data = copy.deepcopy(data)
+
+        min_speed = _number(data, 'min_speed', 640, 0, integer=True)
+        max_speed = _number(data, 'max_speed', 2560, 0, integer=True)
+        if min_speed > max_speed:
+            raise ConfigError(f"'min_speed' ({min_speed}) must not exceed 'max_speed' ({max_speed})")
+        poll_min = _number(data, 'poll_min_ms', 250, 10) / 1000
+        poll_max = _number(data, 'poll_max_ms', 5000, 10) / 1000
+        if poll_min > poll_max:
+            raise ConfigError("'poll_min_ms' must not exceed 'poll_max_ms'")
+
+        battery = _section(data, 'battery')
+        fans = _section(data, 'fans')
+        return cls(
+            min_speed=min_speed,
+            max_speed=max_speed,
+            dynamic_mode=_flag(data, 'dynamic_mode', True),
+            sample_interval=_number(data, 'sample_interval_ms', 1000, 10) / 1000,
+            poll_min=poll_min,
+            poll_max=poll_max,
+            fans={
+                fan_number: cls._fan(data, fans, fan_number, min_speed, max_speed)
+                for fan_number in cls.FAN_NUMBERS
+            },
+            health_mode=_flag(battery, 'health_mode', False),
+            calibration_mode=_flag(battery, 'calibration_mode', False),
+            auto_load_battery_driver=_flag(battery, 'auto_load_battery_driver', True),
+            _data=data
+        )
+
+    @staticmethod
+    def _fan(data, fans, fan_number, min_speed, max_speed):
+        fan = fans.get(str(fan_number), {})
+        if not isinstance(fan, dict):
+            raise ConfigError(f"'fans.{fan_number}' must be an object")
+        where = f"for fan {fan_number} " if 'temp_steps' in fan else ""
+        steps = _temp_steps(fan.get('temp_steps', data.get('temp_steps', [])), where)
+        mode = fan.get('curve_mode', data.get('curve_mode', 'step'))
+        if mode not in FanCurve.MODES:
+            raise ConfigError(f"Unknown curve mode for fan {fan_number}: {mode!r}")
+        source = fan.get('source', 'cpu' if fan_number == 1 else 'gpu')
+        if source not in FanChannel.SOURCES:
+            raise ConfigError(f"Unknown temperature source for fan {fan_number}: {source!r}")
+        coupling = _number(fan, 'coupling', 0.0, 0.0, 1.0)
+
+        config = FanConfig(fan_number, source, float(coupling), FanCurve(steps, mode),
+                           fan.get('controller', data.get('controller')))
+        try:
+            # Build one now so bad controller settings fail here rather than in the fan loop
+            config.build_controller(min_speed, max_speed)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            raise ConfigError(f"Invalid controller for fan {fan_number}: {e}") from None
+        return config
+
+    def with_battery(self, **settings):
+        """A copy with some 'battery' settings changed (health_mode, calibration_mode, ...)."""
+        data = self.to_dict()
+        data.setdefault('battery', {}).update(settings)
+        return self.from_dict(data)
+
+    def to_dict(self):
+        """The configuration as stored, including keys the daemon does not interpret."""
+        return copy.deepcopy(self._data)
+
+
+class ControlState:
+    """
+    What the fan loop acts on: the config and whether dynamic control is on.
+    Never changed in place; writers publish a new one with replace(), so a reader
+    holding a reference always sees a matching pair.
+    """
+    __slots__ = ("config", "dynamic_mode")
+
+    def __init__(self, config, dynamic_mode):
+        object.__setattr__(self, "config", config)
+        object.__setattr__(self, "dynamic_mode", dynamic_mode)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"ControlState is immutable (tried to set {name})")
+
+    def replace(self, config=None, dynamic_mode=None):
+        return ControlState(
+            self.config if config is None else config,
+            self.dynamic_mode if dynamic_mode is None else dynamic_mode
+        )
@@ -0,0 +1,139 @@
+# DAMFC_DriverBuildCache v0.1.0
+# Built fan driver modules kept per kernel release and source hash
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import time
+
+SOURCE_PATTERNS = (".c", ".h")
+SOURCE_NAMES = ("Makefile", "Kbuild")
+GENERATED_SUFFIXES = (".mod.c",)  # Written by kbuild during the build itself
+STAMP_NAME = ".damfc_build"
+LOADED_NAME = "loaded.json"
+BOOT_ID_PATH = "/proc/sys/kernel/random/boot_id"
+
+
+class DriverBuildCache:
+    """
+    Stores built modules under <cache_dir>/<kernel release>/<source hash>/ so a kernel
+    that was seen before gets its module back without running make. The source
+    directory carries a stamp with the key of the module currently built in it, so a
+    module left over from another kernel or older sources is never mistaken for current.
+    """
+
+    def __init__(self, cache_dir="/var/lib/acer_fan_control/driver_cache"):
+        self.cache_dir = cache_dir
+        self.last = {'result': None, 'kernel': None, 'source_hash': None, 'build_duration_s': None}
+
+    @staticmethod
+    def kernel_release():
+        return os.uname().release
+
+    @staticmethod
+    def source_hash(source_dir):
+        """sha256 over the names and contents of the driver sources and Makefile (not build output)."""
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(source_dir)):
+            path = os.path.join(source_dir, name)
+            if name.startswith(".") or name.endswith(GENERATED_SUFFIXES):
+                continue
+            if not os.path.isfile(path) or not (name.endswith(SOURCE_PATTERNS) or name in SOURCE_NAMES):
+                continue
+            digest.update(name.encode() + b"\0")
+            with open(path, "rb") as f:
+                digest.update(f.read())
+            digest.update(b"\0")
+        return digest.hexdigest()[:16]
+
+    def key(self, source_dir):
+        return self.kernel_release(), self.source_hash(source_dir)
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, *key)
+
+    def read_stamp(self, source_dir):
+        try:
+            with open(os.path.join(source_dir, STAMP_NAME)) as f:
+                stamp = json.load(f)
+            return stamp['kernel'], stamp['source_hash']
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def write_stamp(self, source_dir, key):
+        with open(os.path.join(source_dir, STAMP_NAME), "w") as f:
+            json.dump({'kernel': key[0], 'source_hash': key[1]}, f)
+
+    def clear_stamp(self, source_dir):
+        try:
+            os.remove(os.path.join(source_dir, STAMP_NAME))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def boot_id():
+        try:
+            with open(BOOT_ID_PATH) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def record_loaded(self, key):
+        """Remember which build is loaded in this boot; None forgets it (e.g. after rmmod)."""
+        path = os.path.join(self.cache_dir, LOADED_NAME)
+        try:
+            if key is None:
+                if os.path.exists(path):
+                    os.remove(path)
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                json.dump({'kernel': key[0], 'source_hash': key[1], 'boot_id': self.boot_id()}, f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logging.warning(f"Could not record the loaded driver build in {path}: {e}")
+
+    def loaded_key(self):
+        """Key of the build recorded as loaded during the current boot, or None."""
+        try:
+            with open(os.path.join(self.cache_dir, LOADED_NAME)) as f:
+                loaded = json.load(f)
+            if loaded['boot_id'] is None or loaded['boot_id'] != self.boot_id():
+                return None
+            return loaded['kernel'], loaded['source_hash']
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def restore(self, key, module_path):
+        """Copy the cached module for `key` to `module_path`; False if it is not cached."""
+        cached = os.path.join(self.entry_dir(key), os.path.basename(module_path))
+        if not os.path.isfile(cached):
+            return False
+        shutil.copy2(cached, module_path)
+        return True
+
+    def store(self, key, module_path, duration):
+        """Keep a copy of a freshly built module; a failure only costs the next rebuild."""
+        entry = self.entry_dir(key)
+        try:
+            os.makedirs(entry, exist_ok=True)
+            target = os.path.join(entry, os.path.basename(module_path))
+            shutil.copy2(module_path, target + ".tmp")
+            os.replace(target + ".tmp", target)
+            with open(os.path.join(entry, "build.json"), "w") as f:
+                json.dump({'built_at': time.time(), 'build_duration_s': round(duration, 3)}, f)
+        except OSError as e:
+            logging.warning(f"Could not store driver build in cache {entry}: {e}")
+
+    def record(self, result, key, duration=None):
+        self.last = {
+            'result': result,
+            'kernel': key[0],
+            'source_hash': key[1],
+            'build_duration_s': None if duration is None else round(duration, 3)
+        }
+
+    def status(self):
+        return dict(self.last, cache_dir=self.cache_dir)
@@ -3,8 +3,72 @@
 # With Battery Functions to be implemented later in daemon
 
 import os
+import stat
 import subprocess
 import logging
+import time
+import threading
+from contextlib import contextmanager
+from DriverBuildCache import DriverBuildCache
+from BatteryState import BatteryState
+
+
+class ModuleStateCache:
+    """
+    Names of the loaded kernel modules, read from /proc/modules instead of spawning lsmod.
+    The list is kept until invalidate() is called after insmod/rmmod/modprobe, or until it
+    is older than `ttl` seconds, which picks up modules loaded by someone else.
+    Names are matched exactly, with '-' treated as '_' like the kernel does.
+    """
+    
+    def __init__(self, proc_root="/proc", sys_root="/sys", ttl=2.0):
+        self.proc_root = proc_root
+        self.sys_root = sys_root
+        self.ttl = ttl
+        self.reads = 0
+        self._names = None
+        self._read_at = 0.0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def normalize(name):
+        return name.replace("-", "_")
+    
+    def invalidate(self):
+        with self._lock:
+            self._names = None
+    
+    def loaded(self):
+        """Return the frozenset of loaded module names, rereading it when stale."""
+        names = self._names
+        if names is not None and time.monotonic() - self._read_at < self.ttl:
+            return names
+        with self._lock:
+            if self._names is None or time.monotonic() - self._read_at >= self.ttl:
+                self._names = self._read()
+                self._read_at = time.monotonic()
+                self.reads += 1
+            return self._names
+    
+    def is_loaded(self, name):
+        return self.normalize(name) in self.loaded()
+    
+    def _read(self):
+        try:
+            with open(os.path.join(self.proc_root, "modules")) as f:
+                return frozenset(line.split(" ", 1)[0] for line in f if line.strip())
+        except OSError as e:
+            # Fall back to /sys/module, where only loadable modules have an initstate
+            logging.warning(f"Cannot read {self.proc_root}/modules, using {self.sys_root}/module: {e}")
+            module_dir = os.path.join(self.sys_root, "module")
+            try:
+                return frozenset(
+                    name for name in os.listdir(module_dir)
+                    if os.path.exists(os.path.join(module_dir, name, "initstate"))
+                )
+            except OSError:
+                return frozenset()
+
 
 class DriverManager:
     # Use absolute paths to prevent working directory issues
@@ -12,6 +76,8 @@ class DriverManager:
     DRIVER_DIR = "NitroDrivers"
     MODULE_NAME = "acer_nitro_gaming_driver2.ko"
     MODULE_PATH = os.path.join(DRIVER_DIR, MODULE_NAME)
+    # Device class the driver registers /dev/fan1 and /dev/fan2 under
+    DEVICE_CLASS_PATH = "/sys/class/acernitrogaming"
     
     # Battery control paths
     BATTERY_MODULE_NAME = "acer-wmi-battery"
@@ -20,14 +86,62 @@ class DriverManager:
     BATTERY_CALIBRATION_PATH = os.path.join(BATTERY_SYSFS_PATH, "calibration_mode")
     BATTERY_TEMPERATURE_PATH = os.path.join(BATTERY_SYSFS_PATH, "temperature")
     
+    # Loaded-module names shared by every driver check
+    modules = ModuleStateCache()
+    
+    # Built modules per kernel release and source hash
+    build_cache = DriverBuildCache()
+    
+    # Battery attributes and power supply fields read through open handles
+    battery = BatteryState(BATTERY_SYSFS_PATH, lambda: DriverManager.is_battery_driver_loaded())
+    
+    # Per-thread callback that receives make/insmod/rmmod output line by line
+    _output = threading.local()
+    
+    @staticmethod
+    @contextmanager
+    def streaming_output(sink):
+        """Stream the output of driver commands run in this block to `sink` (current thread only)."""
+        DriverManager._output.sink = sink
+        try:
+            yield
+        finally:
+            DriverManager._output.sink = None
+    
+    @staticmethod
+    def run_command(args, cwd=None, shell=False):
+        """subprocess.run with captured text output, streamed to the active sink if any."""
+        sink = getattr(DriverManager._output, 'sink', None)
+        if sink is None:
+            return subprocess.run(args, cwd=cwd, shell=shell, capture_output=True, text=True)
+        
+        sink(f"$ {args if isinstance(args, str) else ' '.join(args)}")
+        process = subprocess.Popen(args, cwd=cwd, shell=shell, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, text=True)
+        
+        def pump(stream, lines):
+            for line in stream:
+                line = line.rstrip('\n')
+                lines.append(line)
+                sink(line)
+        
+        # Both streams go to the sink as they arrive but are returned separately, so
+        # callers can still tell warnings from regular build output
+        errors = []
+        stderr_reader = threading.Thread(target=pump, args=(process.stderr, errors), daemon=True)
+        stderr_reader.start()
+        output = []
+        pump(process.stdout, output)
+        stderr_reader.join()
+        return subprocess.CompletedProcess(args, process.wait(), '\n'.join(output), '\n'.join(errors))
+    
     @staticmethod
     def is_driver_loaded():
         """Check if the module is currently loaded."""
         try:
-            result = subprocess.run(["lsmod"], capture_output=True, text=True)
             module_name = DriverManager.MODULE_NAME.split(".")[0]
-            is_loaded = module_name in result.stdout
-            logging.info(f"Driver status check: {module_name} is {'loaded' if is_loaded else 'not loaded'}")
+            is_loaded = DriverManager.modules.is_loaded(module_name)
+            logging.debug(f"Driver status check: {module_name} is {'loaded' if is_loaded else 'not loaded'}")
             return is_loaded
         except Exception as e:
             logging.error(f"Error checking if driver is loaded: {e}")
@@ -40,9 +154,11 @@ class DriverManager:
             module_name = DriverManager.MODULE_NAME.split(".")[0]
             logging.info(f"Attempting to remove driver: {module_name}")
             
-            result = subprocess.run([ "rmmod", module_name], capture_output=True, text=True)
+            result = DriverManager.run_command([ "rmmod", module_name])
+            DriverManager.modules.invalidate()
             
             if result.returncode == 0:
+                DriverManager.build_cache.record_loaded(None)
                 logging.info("Driver removed successfully")
                 return True
             else:
@@ -71,7 +187,7 @@ class DriverManager:
     
     @staticmethod
     def compile_driver():
-        """Compile the driver if not already compiled."""
+        """Make sure the driver is built for the running kernel, reusing cached builds."""
         try:
             logging.info(f"Checking for driver at: {DriverManager.MODULE_PATH}")
             logging.info(f"Driver directory: {DriverManager.DRIVER_DIR}")
@@ -79,29 +195,43 @@ class DriverManager:
             if not os.path.exists(DriverManager.DRIVER_DIR):
                 logging.error(f"Driver directory not found: {DriverManager.DRIVER_DIR}")
                 return False
-                
-            if not os.path.exists(DriverManager.MODULE_PATH):
-                logging.info("Driver not compiled. Running make...")
-                
-                process = subprocess.run("make", cwd=DriverManager.DRIVER_DIR, shell=True, 
-                                         capture_output=True, text=True)
-                
-                if process.returncode != 0:
-                    logging.error(f"Make failed: {process.stderr}")
-                    return False
-                
-                if process.stderr:
-                    logging.warning(f"Make warnings: {process.stderr}")
-                
-                if not os.path.exists(DriverManager.MODULE_PATH):
-                    logging.error(f"Driver file not found after compilation: {DriverManager.MODULE_PATH}")
-                    return False
-                
-                logging.info("Driver compiled successfully")
-                return True
-            else:
+            
+            cache = DriverManager.build_cache
+            key = cache.key(DriverManager.DRIVER_DIR)
+            
+            if os.path.exists(DriverManager.MODULE_PATH) and cache.read_stamp(DriverManager.DRIVER_DIR) == key:
                 logging.info("Using existing compiled driver")
+                cache.record("current", key)
+                return True
+            
+            if cache.restore(key, DriverManager.MODULE_PATH):
+                cache.write_stamp(DriverManager.DRIVER_DIR, key)
+                logging.info(f"Using cached driver build for kernel {key[0]}")
+                cache.record("hit", key)
                 return True
+            
+            logging.info(f"No driver build for kernel {key[0]}. Running make...")
+            cache.clear_stamp(DriverManager.DRIVER_DIR)
+            start = time.monotonic()
+            process = DriverManager.run_command(["make", f"-j{os.cpu_count() or 1}"], cwd=DriverManager.DRIVER_DIR)
+            duration = time.monotonic() - start
+            
+            if process.returncode != 0:
+                logging.error(f"Make failed: {process.stderr}")
+                return False
+            
+            if process.stderr:
+                logging.warning(f"Make warnings: {process.stderr}")
+            
+            if not os.path.exists(DriverManager.MODULE_PATH):
+                logging.error(f"Driver file not found after compilation: {DriverManager.MODULE_PATH}")
+                return False
+            
+            cache.write_stamp(DriverManager.DRIVER_DIR, key)
+            cache.store(key, DriverManager.MODULE_PATH, duration)
+            cache.record("miss", key, duration)
+            logging.info(f"Driver compiled successfully in {duration:.1f}s")
+            return True
         except Exception as e:
             logging.error(f"Error during driver compilation: {e}")
             return False
@@ -113,8 +243,8 @@ class DriverManager:
             if os.path.exists(DriverManager.DRIVER_DIR):
                 logging.info("Running make clean...")
                 
-                process = subprocess.run("make clean", cwd=DriverManager.DRIVER_DIR, shell=True, 
-                                         capture_output=True, text=True)
+                DriverManager.build_cache.clear_stamp(DriverManager.DRIVER_DIR)
+                process = DriverManager.run_command("make clean", cwd=DriverManager.DRIVER_DIR, shell=True)
                 
                 if process.returncode != 0:
                     logging.error(f"Make clean failed: {process.stderr}")
@@ -139,10 +269,11 @@ class DriverManager:
             
             logging.info(f"Loading driver: {DriverManager.MODULE_PATH}")
             
-            result = subprocess.run([ "insmod", os.path.abspath(DriverManager.MODULE_PATH)], 
-                                    capture_output=True, text=True)
+            result = DriverManager.run_command([ "insmod", os.path.abspath(DriverManager.MODULE_PATH)])
+            DriverManager.modules.invalidate()
             
             if result.returncode == 0:
+                DriverManager.build_cache.record_loaded(DriverManager.build_cache.read_stamp(DriverManager.DRIVER_DIR))
                 logging.info("Driver loaded successfully")
                 return True
             else:
@@ -152,23 +283,50 @@ class DriverManager:
             logging.error(f"Error loading driver: {e}")
             return False
     
+    @staticmethod
+    def device_nodes_valid(dev_root="/dev"):
+        """Check /dev/fanN are char devices with the numbers the driver registered in sysfs."""
+        for fan in ("fan1", "fan2"):
+            try:
+                with open(os.path.join(DriverManager.DEVICE_CLASS_PATH, fan, "dev")) as f:
+                    major, minor = (int(part) for part in f.read().strip().split(":"))
+                node = os.stat(os.path.join(dev_root, fan))
+            except (OSError, ValueError) as e:
+                logging.info(f"Device node {fan} cannot be verified: {e}")
+                return False
+            if not stat.S_ISCHR(node.st_mode) or (os.major(node.st_rdev), os.minor(node.st_rdev)) != (major, minor):
+                logging.info(f"Device node {fan} does not match the driver ({major}:{minor})")
+                return False
+        return True
+    
+    @staticmethod
+    def can_warm_start(dev_root="/dev"):
+        """True when the loaded driver is the current build and its device nodes are intact."""
+        if not DriverManager.is_driver_loaded():
+            return False
+        if not os.path.exists(DriverManager.DRIVER_DIR):
+            return False
+        loaded = DriverManager.build_cache.loaded_key()
+        if loaded is None or loaded != DriverManager.build_cache.key(DriverManager.DRIVER_DIR):
+            logging.info("Loaded driver is not the current build")
+            return False
+        return DriverManager.device_nodes_valid(dev_root)
+    
     @staticmethod
     def get_driver_status():
         """Return a dict with driver status information."""
+        battery = DriverManager.get_battery_status()
+        battery["is_loaded"] = battery.pop("driver_loaded")
         return {
             "is_loaded": DriverManager.is_driver_loaded(),
             "driver_path": os.path.abspath(DriverManager.MODULE_PATH) if os.path.exists(DriverManager.MODULE_PATH) else None,
             "driver_directory_exists": os.path.exists(DriverManager.DRIVER_DIR),
+            "build": DriverManager.build_cache.status(),
             "device_files": {
                 "fan1": os.path.exists("/dev/fan1"),
                 "fan2": os.path.exists("/dev/fan2")
             },
-            "battery_driver": {
-                "is_loaded": DriverManager.is_battery_driver_loaded(),
-                "health_mode": DriverManager.get_battery_health_mode(),
-                "calibration_mode": DriverManager.get_battery_calibration_mode(),
-                "temperature": DriverManager.get_battery_temperature(),
-            }
+            "battery_driver": battery
         }
     
     @staticmethod
@@ -181,6 +339,24 @@ class DriverManager:
             return True
         return False
     
+    @staticmethod
+    def set_build_cache_dir(cache_dir):
+        """Keep cached driver builds in another directory."""
+        DriverManager.build_cache = DriverBuildCache(cache_dir)
+        logging.info(f"Driver build cache set to: {cache_dir}")
+    
+    @staticmethod
+    def set_battery_sysfs_path(sysfs_path):
+        """Point the battery attribute paths at another directory (e.g. a simulated tree)."""
+        DriverManager.BATTERY_SYSFS_PATH = sysfs_path
+        DriverManager.BATTERY_HEALTH_PATH = os.path.join(sysfs_path, "health_mode")
+        DriverManager.BATTERY_CALIBRATION_PATH = os.path.join(sysfs_path, "calibration_mode")
+        DriverManager.BATTERY_TEMPERATURE_PATH = os.path.join(sysfs_path, "temperature")
+        DriverManager.battery.close()
+        DriverManager.battery = BatteryState(sysfs_path, DriverManager.battery.is_loaded,
+                                             DriverManager.battery.power_supply_root)
+        logging.info(f"Battery sysfs path set to: {sysfs_path}")
+    
     @staticmethod
     def ensure_driver_loaded():
         """Make sure the driver is loaded, loading it if necessary."""
@@ -192,7 +368,7 @@ class DriverManager:
             logging.error(f"Driver directory not found: {DriverManager.DRIVER_DIR}")
             return False
             
-        if not os.path.exists(DriverManager.MODULE_PATH) and not DriverManager.compile_driver():
+        if not DriverManager.compile_driver():
             logging.error("Failed to compile driver")
             return False
         
@@ -203,9 +379,8 @@ class DriverManager:
     def is_battery_driver_loaded():
         """Check if the Acer WMI battery driver is loaded."""
         try:
-            result = subprocess.run(["lsmod"], capture_output=True, text=True)
-            is_loaded = DriverManager.BATTERY_MODULE_NAME in result.stdout
-            logging.info(f"Battery driver status check: {DriverManager.BATTERY_MODULE_NAME} is {'loaded' if is_loaded else 'not loaded'}")
+            is_loaded = DriverManager.modules.is_loaded(DriverManager.BATTERY_MODULE_NAME)
+            logging.debug(f"Battery driver status check: {DriverManager.BATTERY_MODULE_NAME} is {'loaded' if is_loaded else 'not loaded'}")
             return is_loaded
         except Exception as e:
             logging.error(f"Error checking if battery driver is loaded: {e}")
@@ -218,6 +393,8 @@ class DriverManager:
             logging.info(f"Loading Acer WMI battery driver: {DriverManager.BATTERY_MODULE_NAME}")
             result = subprocess.run(["modprobe", DriverManager.BATTERY_MODULE_NAME], 
                                    capture_output=True, text=True)
+            DriverManager.modules.invalidate()
+            DriverManager.battery.close()
             
             if result.returncode == 0:
                 logging.info("Battery driver loaded successfully")
@@ -236,6 +413,8 @@ class DriverManager:
             logging.info(f"Unloading Acer WMI battery driver: {DriverManager.BATTERY_MODULE_NAME}")
             result = subprocess.run(["rmmod", DriverManager.BATTERY_MODULE_NAME], 
                                    capture_output=True, text=True)
+            DriverManager.modules.invalidate()
+            DriverManager.battery.close()
             
             if result.returncode == 0:
                 logging.info("Battery driver unloaded successfully")
@@ -256,6 +435,11 @@ class DriverManager:
         else:
             return DriverManager.load_battery_driver()
     
+    @staticmethod
+    def get_battery_status():
+        """Return the driver state, battery modes, temperature and power supply fields in one pass."""
+        return DriverManager.battery.read()
+    
     @staticmethod
     def get_battery_health_mode():
         """Get the current battery health mode state."""
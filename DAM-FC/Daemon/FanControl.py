@@ -0,0 +1,378 @@
+# DAMFC_FanControl v0.1.0
+# Building blocks for the dynamic fan control loop
+
+import os
+import time
+import logging
+import threading
+from Metrics import LatencyHistogram
+
+
+class FanCurve:
+    """
+    temp_steps compiled once into a lookup table indexed by whole degrees Celsius.
+    In "step" mode a temperature maps to the speed of the highest step it has reached
+    (None below the first step, leaving the fans untouched). In "linear" mode speeds are
+    interpolated between steps and held flat below the first and above the last one.
+    """
+
+    MODES = ("step", "linear")
+    MAX_TEMP = 120
+
+    def __init__(self, temp_steps, mode="step"):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown fan curve mode: {mode}")
+        self.mode = mode
+        self.steps = tuple(sorted((int(step['temperature']), int(step['speed'])) for step in temp_steps))
+        self.thresholds = tuple(temperature for temperature, _ in self.steps)
+        self.table = self._compile()
+
+    def _compile(self):
+        table = [None] * (self.MAX_TEMP + 1)
+        if not self.steps:
+            return table
+
+        for temp in range(self.MAX_TEMP + 1):
+            if self.mode == "step":
+                for threshold, speed in self.steps:
+                    if temp >= threshold:
+                        table[temp] = speed
+            elif temp <= self.steps[0][0]:
+                table[temp] = self.steps[0][1]
+            elif temp >= self.steps[-1][0]:
+                table[temp] = self.steps[-1][1]
+            else:
+                for (low_temp, low_speed), (high_temp, high_speed) in zip(self.steps, self.steps[1:]):
+                    if low_temp <= temp <= high_temp:
+                        fraction = (temp - low_temp) / (high_temp - low_temp) if high_temp > low_temp else 1
+                        table[temp] = int(round(low_speed + fraction * (high_speed - low_speed)))
+                        break
+        return table
+
+    def speed(self, temp):
+        """Return the fan speed for `temp` °C, or None if the fans should be left alone."""
+        if temp <= 0:
+            return self.table[0]
+        if temp >= self.MAX_TEMP:
+            return self.table[self.MAX_TEMP]
+        return self.table[int(temp)]
+
+
+class CurveController:
+    """Fan speed straight from the fan curve (the classic step table)."""
+    name = "curve"
+
+    def __init__(self, curve):
+        self.curve = curve
+        self.thresholds = curve.thresholds
+
+    def update(self, temp, now):
+        return self.curve.speed(temp)
+
+    def reset(self):
+        pass
+
+
+class PidController:
+    """
+    PID controller that holds the temperature at `target` °C.
+    Output is min_speed plus the PID terms, clamped to [min_speed, max_speed] and rounded
+    to multiples of `quantum` so small corrections do not turn into a write every tick.
+    The integral only grows while the output is not saturated (anti-windup) and the
+    derivative acts on the measurement, not the error, to avoid kicks on target changes.
+    """
+    name = "pid"
+
+    def __init__(self, target, min_speed, max_speed, kp=120.0, ki=3.0, kd=0.0, quantum=32):
+        self.target = target
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.quantum = quantum
+        self.thresholds = (target,)
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self._last_temp = None
+        self._last_time = None
+
+    def update(self, temp, now):
+        error = temp - self.target  # Positive when too hot
+        dt = now - self._last_time if self._last_time is not None else 0.0
+        derivative = (temp - self._last_temp) / dt if dt > 0 else 0.0
+        self._last_temp = temp
+        self._last_time = now
+
+        integral = self.integral + error * dt
+        output = self.min_speed + self.kp * error + self.ki * integral + self.kd * derivative
+        if self.min_speed < output < self.max_speed:
+            self.integral = integral
+        elif (output >= self.max_speed) == (error < 0):
+            # Saturated, but the error is already pulling the output back into range
+            self.integral = integral
+
+        output = min(max(output, self.min_speed), self.max_speed)
+        if self.quantum > 1:
+            output = round(output / self.quantum) * self.quantum
+        return int(min(max(output, self.min_speed), self.max_speed))
+
+
+CONTROLLERS = ("curve", "pid")
+
+
+def build_controller(spec, curve, min_speed, max_speed):
+    """Build a controller from its config entry: "curve", "pid" or {"type": ..., ...}."""
+    if spec is None:
+        spec = {"type": "curve"}
+    elif isinstance(spec, str):
+        spec = {"type": spec}
+
+    kind = spec.get("type", "curve")
+    if kind == "curve":
+        return CurveController(curve)
+    if kind == "pid":
+        options = {key: float(spec[key]) for key in ("kp", "ki", "kd") if key in spec}
+        if "quantum" in spec:
+            options["quantum"] = int(spec["quantum"])
+        return PidController(float(spec.get("target", 75)), min_speed, max_speed, **options)
+    raise ValueError(f"Unknown controller type: {kind}")
+
+
+class AdaptiveInterval:
+    """
+    Picks the fan loop's next poll interval from the temperature trend.
+    Polls at `min_interval` while the temperature moves quickly or sits close to a
+    curve step, and doubles the interval up to `max_interval` while it is stable.
+    """
+
+    def __init__(self, min_interval=0.25, max_interval=5.0, slope_threshold=0.5, step_margin=3,
+                 smoothing=0.5):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.slope_threshold = slope_threshold  # °C per second
+        self.step_margin = step_margin  # °C either side of a curve threshold
+        self.smoothing = smoothing  # Weight of the newest slope in the moving average
+        self.interval = min_interval
+        self.slope = 0.0
+        self.wakeups = 0
+        self._last_temp = None
+        self._last_time = None
+
+    def configure(self, min_interval, max_interval):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.interval = min(max(self.interval, self.min_interval), self.max_interval)
+
+    def update(self, temp, now, thresholds=()):
+        """Feed the latest temperature (taken at monotonic time `now`) and return the next interval."""
+        self.wakeups += 1
+        if self._last_time is not None and now > self._last_time:
+            slope = (temp - self._last_temp) / (now - self._last_time)
+            self.slope = self.smoothing * slope + (1 - self.smoothing) * self.slope
+        self._last_temp = temp
+        self._last_time = now
+
+        near_step = any(abs(temp - threshold) <= self.step_margin for threshold in thresholds)
+        if abs(self.slope) >= self.slope_threshold or near_step:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+        return self.interval
+
+    def idle(self):
+        """Interval to sleep while dynamic control is disabled."""
+        self._last_temp = None
+        self._last_time = None
+        self.interval = self.max_interval
+        return self.interval
+
+    def status(self):
+        return {
+            'interval_ms': int(self.interval * 1000),
+            'min_interval_ms': int(self.min_interval * 1000),
+            'max_interval_ms': int(self.max_interval * 1000),
+            'slope': round(self.slope, 3),
+            'wakeups': self.wakeups
+        }
+
+
+class FanChannel:
+    """
+    Control state of one fan: the sensor it follows, its controller and its own poll schedule.
+    The input temperature is the fan's own sensor plus `coupling` times however much
+    hotter the other sensor is, so 0 ignores the other sensor and 1 follows the hotter one.
+    """
+
+    SOURCES = ("cpu", "gpu")
+
+    def __init__(self, fan_number, scheduler=None):
+        self.fan_number = fan_number
+        self.scheduler = scheduler or AdaptiveInterval()
+        self.source = "cpu"
+        self.coupling = 0.0
+        self.controller = CurveController(FanCurve([]))
+        self.next_due = 0.0
+        self.input_temp = None
+        self.target = None
+
+    def configure(self, source, coupling, controller):
+        if source not in self.SOURCES:
+            raise ValueError(f"Unknown temperature source for fan {self.fan_number}: {source}")
+        coupling = float(coupling)
+        if not 0.0 <= coupling <= 1.0:
+            raise ValueError(f"Coupling for fan {self.fan_number} must be between 0 and 1: {coupling}")
+        self.source = source
+        self.coupling = coupling
+        self.controller = controller
+        self.next_due = 0.0  # Re-evaluate with the new settings right away
+
+    def temperature(self, snapshot):
+        own, other = snapshot.cpu_temp, snapshot.gpu_temp
+        if self.source == "gpu":
+            own, other = other, own
+        if own is None:
+            # Own sensor unreadable (e.g. dGPU asleep): follow the other one as if fully coupled
+            return other or 0
+        if other is None:
+            return own
+        return own + self.coupling * max(0, other - own)
+
+    def evaluate(self, snapshot, now):
+        """Return the speed this fan should run at (or None) and schedule the next evaluation."""
+        controller = self.controller
+        self.input_temp = self.temperature(snapshot)
+        self.target = controller.update(self.input_temp, now)
+        self.next_due = now + self.scheduler.update(self.input_temp, snapshot.monotonic, controller.thresholds)
+        return self.target
+
+    def idle(self):
+        self.next_due = 0.0
+        self.controller.reset()
+        return self.scheduler.idle()
+
+    def status(self):
+        status = self.scheduler.status()
+        status.update({
+            'source': self.source,
+            'coupling': self.coupling,
+            'controller': self.controller.name,
+            'input_temp': self.input_temp,
+            'target': self.target
+        })
+        return status
+
+
+class FanActuator:
+    """
+    Writes fan speeds to the /dev/fanN character devices through handles that stay open.
+    Repeated writes of the same value are skipped and a failed write reopens the device
+    once, which covers a driver reload. The driver pins itself while a handle is open,
+    so call suspend() before unloading it and resume() once it is loaded again.
+    """
+
+    def __init__(self, dev_root="/dev"):
+        self.dev_root = dev_root
+        self.suspended = False
+        self.last_written = {}
+        self.writes = 0
+        self.skipped = 0
+        self.errors = 0
+        self.reopens = 0
+        self.latency = LatencyHistogram()
+        self._fds = {}
+        self._lock = threading.Lock()  # The fan loop and IPC commands both write
+
+    def path(self, fan_number):
+        return os.path.join(self.dev_root, f"fan{fan_number}")
+
+    def write(self, fan_number, speed):
+        """Write `speed` to the fan; returns False when the value was already set."""
+        with self._lock:
+            if self.suspended:
+                raise FileNotFoundError(f"Fan control suspended while the driver reloads: {self.path(fan_number)}")
+            if self.last_written.get(fan_number) == speed:
+                self.skipped += 1
+                return False
+
+            data = f"{speed}\n".encode()
+            start = time.perf_counter()
+            try:
+                self._write(fan_number, data)
+            except OSError:
+                self.errors += 1
+                raise
+            self.latency.record(time.perf_counter() - start)
+            self.writes += 1
+            self.last_written[fan_number] = speed
+            return True
+
+    def _write(self, fan_number, data):
+        fd = self._fds.get(fan_number)
+        if fd is not None and not self._is_current(fd, fan_number):
+            # The device node was recreated (driver reloaded behind our back)
+            self._close(fan_number)
+            self.reopens += 1
+            fd = None
+        if fd is not None:
+            try:
+                os.write(fd, data)
+                return
+            except OSError as e:
+                # Stale handle; reopen once
+                logging.warning(f"Reopening {self.path(fan_number)} after write error: {e}")
+                self._close(fan_number)
+                self.reopens += 1
+        fd = os.open(self.path(fan_number), os.O_WRONLY)
+        self._fds[fan_number] = fd
+        os.write(fd, data)
+
+    def _is_current(self, fd, fan_number):
+        try:
+            opened = os.fstat(fd)
+            current = os.stat(self.path(fan_number))
+        except OSError:
+            return False
+        return (opened.st_ino, opened.st_rdev) == (current.st_ino, current.st_rdev)
+
+    def _close(self, fan_number):
+        fd = self._fds.pop(fan_number, None)
+        if fd is not None:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _close_all(self):
+        for fan_number in list(self._fds):
+            self._close(fan_number)
+        self.last_written.clear()
+
+    def close(self):
+        """Release every device handle and forget the last written values."""
+        with self._lock:
+            self._close_all()
+
+    def suspend(self):
+        """Release the handles and refuse writes until resume(), e.g. around rmmod."""
+        with self._lock:
+            self._close_all()
+            self.suspended = True
+
+    def resume(self):
+        with self._lock:
+            self.suspended = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'writes': self.writes,
+                'skipped': self.skipped,
+                'errors': self.errors,
+                'reopens': self.reopens,
+                'suspended': self.suspended,
+                'last_written': dict(self.last_written),
+                'write_latency': self.latency.to_dict()
+            }
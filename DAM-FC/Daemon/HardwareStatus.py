@@ -1,28 +1,362 @@
-# DAMFC_HardwareStatus v0.1.2
-import psutil
+# DAMFC_HardwareStatus v0.1.3
+import os
+import time
+import glob
+import threading
+import shutil
+import ctypes
+import logging
 import subprocess
 import re
 
+try:
+    import psutil
+except ImportError:  # Only needed as a fallback when hwmon is unreadable
+    psutil = None
+
+def _natural_key(name):
+    """Sort key that orders hwmon2 before hwmon10 and temp2_input before temp10_input."""
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+class HwmonSensor:
+    """One hwmon `*_input` attribute kept open for repeated reads."""
+    __slots__ = ("chip", "label", "kind", "path", "fd")
+
+    def __init__(self, chip, label, kind, path, fd):
+        self.chip = chip
+        self.label = label
+        self.kind = kind
+        self.path = path
+        self.fd = fd
+
+
+class HwmonSensorEngine:
+    """
+    Discovers hwmon sensors once and reads them with os.pread on open fds. Which
+    sensors give the CPU temperature and the CPU/GPU fan speeds is decided at discovery
+    too, so a read never searches (or forks) again.
+    """
+
+    CPU_CHIPS = ("coretemp", "k10temp", "zenpower")
+    # Whole-package readings (coretemp, k10temp/zenpower), preferred over single cores
+    CPU_PACKAGE_LABELS = ("package id", "tctl", "tdie")
+    INPUT_PATTERN = re.compile(r"^(temp|fan)(\d+)_input$")
+
+    def __init__(self, root="/sys/class/hwmon"):
+        self.root = root
+        self.sensors = []
+        self.cpu_sensors = []  # Package sensors first, then the rest, in CPU_CHIPS order
+        self.cpu_fan = None
+        self.gpu_fan = None
+        self.discover()
+
+    def discover(self):
+        """(Re)scan the hwmon tree and open every temperature and fan input."""
+        self.close()
+        for hwmon in sorted(glob.glob(os.path.join(self.root, "hwmon*")), key=_natural_key):
+            chip = self._read_text(os.path.join(hwmon, "name")) or os.path.basename(hwmon)
+            try:
+                entries = sorted(os.listdir(hwmon), key=_natural_key)
+            except OSError:
+                continue
+            for entry in entries:
+                match = self.INPUT_PATTERN.match(entry)
+                if not match:
+                    continue
+                kind, index = match.groups()
+                path = os.path.join(hwmon, entry)
+                label = self._read_text(os.path.join(hwmon, f"{kind}{index}_label")) or f"{kind}{index}"
+                try:
+                    fd = os.open(path, os.O_RDONLY)
+                except OSError as e:
+                    logging.debug(f"Skipping unreadable hwmon input {path}: {e}")
+                    continue
+                self.sensors.append(HwmonSensor(chip, label, kind, path, fd))
+
+        self.cpu_sensors = list(dict.fromkeys(
+            sensor
+            for chip in self.CPU_CHIPS
+            for label in self.CPU_PACKAGE_LABELS + (None,)
+            for sensor in self.find("temp", chip, label)
+        ))
+        self.cpu_fan = self._pick_fan("cpu", 0)
+        self.gpu_fan = self._pick_fan("gpu", 1)
+        logging.info(f"Discovered {len(self.sensors)} hwmon sensors under {self.root}")
+        if self.cpu_fan is None and self.gpu_fan is None:
+            logging.info("No hwmon fan inputs, fan speeds will not be reported")
+
+    def close(self):
+        for sensor in self.sensors:
+            try:
+                os.close(sensor.fd)
+            except OSError:
+                pass
+        self.sensors = []
+        self.cpu_sensors = []
+        self.cpu_fan = None
+        self.gpu_fan = None
+
+    @staticmethod
+    def _read_text(path):
+        try:
+            with open(path, "r") as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    @staticmethod
+    def read(sensor):
+        """Return the raw integer value of a sensor, or None if unreadable."""
+        try:
+            return int(os.pread(sensor.fd, 32, 0))
+        except (OSError, ValueError):
+            return None
+
+    def find(self, kind, chip=None, label=None):
+        """Return the sensors of `kind`, optionally filtered by chip and label substring."""
+        return [
+            sensor for sensor in self.sensors
+            if sensor.kind == kind
+            and (chip is None or sensor.chip == chip)
+            and (label is None or label in sensor.label.lower())
+        ]
+
+    def read_temp(self, chip, label=None):
+        """Return the first matching temperature in whole degrees Celsius."""
+        for sensor in self.find("temp", chip, label):
+            value = self.read(sensor)
+            if value is not None:
+                return int(round(value / 1000))
+        return None
+
+    def cpu_temp(self):
+        for sensor in self.cpu_sensors:
+            value = self.read(sensor)
+            if value is not None:
+                return int(round(value / 1000))
+        return None
+
+    def _pick_fan(self, keyword, fallback_index):
+        fans = self.find("fan")
+        for sensor in fans:
+            # Same label heuristics as the lm-sensors based helpers
+            if keyword in sensor.label.lower() or sensor.label == f"fan{fallback_index + 1}":
+                return sensor
+        return fans[fallback_index] if len(fans) > fallback_index else None
+
+    def cpu_fan_speed(self):
+        return None if self.cpu_fan is None else self.read(self.cpu_fan)
+
+    def gpu_fan_speed(self):
+        return None if self.gpu_fan is None else self.read(self.gpu_fan)
+
+
+_hwmon_engine = None
+_hwmon_lock = threading.Lock()  # Startup probes and early IPC reads may race
+
+
+def get_hwmon_engine():
+    """Return the process-wide hwmon engine, discovering sensors on first use."""
+    global _hwmon_engine
+    if _hwmon_engine is None:
+        with _hwmon_lock:
+            if _hwmon_engine is None:
+                _hwmon_engine = HwmonSensorEngine()
+    return _hwmon_engine
+
+
+def set_hwmon_engine(engine):
+    """Replace the process-wide hwmon engine (e.g. one rooted at a fake tree)."""
+    global _hwmon_engine
+    if _hwmon_engine is not None and _hwmon_engine is not engine:
+        _hwmon_engine.close()
+    _hwmon_engine = engine
+
+
+_psutil_cpu_temp = psutil is not None  # Cleared once psutil has no CPU sensor either
+
+
 def get_cpu_temp():
-    """Get CPU temperature using psutil and round to an integer."""
+    """Get CPU temperature from hwmon and round to an integer."""
+    global _psutil_cpu_temp
+    engine = get_hwmon_engine()
+    if engine.cpu_sensors:
+        return engine.cpu_temp()
+    if not _psutil_cpu_temp:
+        return None
     try:
         sensors = psutil.sensors_temperatures()
         if "coretemp" in sensors:  # Intel & AMD CPUs
             return int(round(sensors["coretemp"][0].current))
-        return None  # Return None if temperature is unavailable
     except AttributeError:
-        return None
+        pass
+    # Do not walk psutil again on every snapshot
+    logging.warning("No CPU temperature sensor found in hwmon or psutil")
+    _psutil_cpu_temp = False
+    return None
 
-def get_gpu_temp():
-    """Get NVIDIA GPU temperature using nvidia-smi."""
-    try:
-        output = subprocess.check_output(
-            ["nvidia-smi", "--query-gpu=temperature.gpu", "--format=csv,noheader"],
-            text=True
+class GpuBackendError(Exception):
+    """Raised when a GPU temperature backend cannot be initialized."""
+
+
+class NvmlGpuBackend:
+    """Reads the GPU temperature in-process through a long-lived NVML handle."""
+    name = "nvml"
+
+    NVML_SUCCESS = 0
+    NVML_TEMPERATURE_GPU = 0
+    LIBRARY_NAMES = ("libnvidia-ml.so.1", "libnvidia-ml.so")
+
+    def __init__(self, index=0):
+        self._lib = None
+        for library in self.LIBRARY_NAMES:
+            try:
+                self._lib = ctypes.CDLL(library)
+                break
+            except OSError:
+                continue
+        if self._lib is None:
+            raise GpuBackendError("libnvidia-ml not found")
+
+        ret = self._lib.nvmlInit_v2()
+        if ret != self.NVML_SUCCESS:
+            raise GpuBackendError(f"nvmlInit_v2 failed with code {ret}")
+
+        self._handle = ctypes.c_void_p()
+        ret = self._lib.nvmlDeviceGetHandleByIndex_v2(ctypes.c_uint(index), ctypes.byref(self._handle))
+        if ret != self.NVML_SUCCESS:
+            self._lib.nvmlShutdown()
+            raise GpuBackendError(f"nvmlDeviceGetHandleByIndex_v2 failed with code {ret}")
+
+        # Reused for every read so the hot path does not allocate
+        self._temp = ctypes.c_uint()
+        self._temp_ref = ctypes.byref(self._temp)
+        self._get_temperature = self._lib.nvmlDeviceGetTemperature
+
+    def read_temp(self):
+        ret = self._get_temperature(self._handle, self.NVML_TEMPERATURE_GPU, self._temp_ref)
+        if ret != self.NVML_SUCCESS:
+            return None
+        return int(self._temp.value)
+
+    def close(self):
+        if self._lib is not None:
+            self._lib.nvmlShutdown()
+            self._lib = None
+
+
+class HwmonGpuBackend:
+    """Reads the GPU temperature from the amdgpu/nouveau hwmon sysfs node."""
+    name = "hwmon"
+
+    DRIVER_NAMES = ("amdgpu", "nouveau")
+
+    def __init__(self, engine=None):
+        self._engine = engine or get_hwmon_engine()
+        self._chip = next(
+            (chip for chip in self.DRIVER_NAMES if self._engine.find("temp", chip)), None
         )
-        return int(output.strip())
-    except Exception:
+        if self._chip is None:
+            raise GpuBackendError(f"No amdgpu/nouveau hwmon node under {self._engine.root}")
+        self.name = f"hwmon:{self._chip}"
+
+    def read_temp(self):
+        return self._engine.read_temp(self._chip)
+
+    def close(self):
+        pass
+
+
+class NvidiaSmiGpuBackend:
+    """Last-resort backend that forks nvidia-smi for every read."""
+    name = "nvidia-smi"
+
+    def __init__(self):
+        if shutil.which("nvidia-smi") is None:
+            raise GpuBackendError("nvidia-smi not found in PATH")
+
+    def read_temp(self):
+        try:
+            output = subprocess.check_output(
+                ["nvidia-smi", "--query-gpu=temperature.gpu", "--format=csv,noheader"],
+                text=True
+            )
+            return int(output.strip())
+        except Exception:
+            return None
+
+    def close(self):
+        pass
+
+
+class FakeGpuBackend:
+    """In-memory backend for machines without a GPU; set `temp` to drive it."""
+    name = "fake"
+
+    def __init__(self, temp=40):
+        self.temp = temp
+
+    def read_temp(self):
+        return self.temp
+
+    def close(self):
+        pass
+
+
+GPU_BACKENDS = {
+    "nvml": NvmlGpuBackend,
+    "hwmon": HwmonGpuBackend,
+    "nvidia-smi": NvidiaSmiGpuBackend,
+    "fake": FakeGpuBackend,
+}
+DEFAULT_GPU_BACKEND_ORDER = ("nvml", "hwmon", "nvidia-smi")
+
+_gpu_backend = None
+_gpu_backend_probed = False
+_gpu_backend_lock = threading.Lock()
+
+
+def probe_gpu_backend(order=DEFAULT_GPU_BACKEND_ORDER):
+    """Return the first GPU backend in `order` that initializes, or None."""
+    for name in order:
+        try:
+            backend = GPU_BACKENDS[name]()
+            logging.info(f"Using GPU temperature backend: {backend.name}")
+            return backend
+        except Exception as e:
+            logging.debug(f"GPU backend {name} unavailable: {e}")
+    logging.warning("No GPU temperature backend available")
+    return None
+
+
+def get_gpu_backend():
+    """Return the process-wide GPU backend, probing it on first use."""
+    global _gpu_backend, _gpu_backend_probed
+    if not _gpu_backend_probed:
+        with _gpu_backend_lock:
+            if not _gpu_backend_probed:
+                _gpu_backend = probe_gpu_backend()
+                _gpu_backend_probed = True
+    return _gpu_backend
+
+
+def set_gpu_backend(backend):
+    """Replace the process-wide GPU backend (e.g. with a FakeGpuBackend)."""
+    global _gpu_backend, _gpu_backend_probed
+    if _gpu_backend is not None and _gpu_backend is not backend:
+        _gpu_backend.close()
+    _gpu_backend = backend
+    _gpu_backend_probed = True
+
+
+def get_gpu_temp():
+    """Get GPU temperature from the active backend (NVML, hwmon or nvidia-smi)."""
+    backend = get_gpu_backend()
+    if backend is None:
         return "N/A"
+    temp = backend.read_temp()
+    return "N/A" if temp is None else temp
 
 def get_fan_speed():
     """Get fan speeds using lm-sensors."""
@@ -34,35 +368,119 @@ def get_fan_speed():
         return "N/A"
     
 def get_cpu_fan_speed():
-    """Extracts the CPU fan speed from lm-sensors output."""
-    try:
-        output = subprocess.check_output(["sensors"], text=True)
+    """
+    Get the CPU fan speed from hwmon, or None without a hwmon fan input. lm-sensors
+    reads the same hwmon inputs, so forking `sensors` could not find one either.
+    """
+    return get_hwmon_engine().cpu_fan_speed()
 
-        # Match lines containing "CPU" or the first available fan as fallback
-        fan_speeds = re.findall(r"(.+?):\s+(\d+)\s*RPM", output)
+def get_gpu_fan_speed():
+    """Get the GPU fan speed from hwmon, or None without a hwmon fan input."""
+    return get_hwmon_engine().gpu_fan_speed()
 
-        for label, speed in fan_speeds:
-            if "cpu" in label.lower() or "fan1" in label.lower():  # Common labels for CPU fans
-                return int(speed)
 
-        # If CPU label isn't found, return the first available fan speed
-        return int(fan_speeds[0][1]) if fan_speeds else None
-    except Exception:
-        return None
+class HardwareSnapshot:
+    """All sensor readings captured in a single sampling pass."""
+    __slots__ = ("cpu_temp", "gpu_temp", "cpu_fan_rpm", "gpu_fan_rpm", "battery_temp",
+                 "timestamp", "monotonic")
 
-def get_gpu_fan_speed():
-    """Extracts the GPU fan speed from lm-sensors output."""
-    try:
-        output = subprocess.check_output(["sensors"], text=True)
+    def __init__(self, cpu_temp=None, gpu_temp=None, cpu_fan_rpm=None, gpu_fan_rpm=None,
+                 battery_temp=None, timestamp=None, monotonic=None):
+        self.cpu_temp = cpu_temp
+        self.gpu_temp = gpu_temp
+        self.cpu_fan_rpm = cpu_fan_rpm
+        self.gpu_fan_rpm = gpu_fan_rpm
+        self.battery_temp = battery_temp
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.monotonic = time.monotonic() if monotonic is None else monotonic
 
-        # Match lines containing "GPU" or other likely labels
-        fan_speeds = re.findall(r"(.+?):\s+(\d+)\s*RPM", output)
+    def to_dict(self):
+        return {
+            'cpu_temp': self.cpu_temp if self.cpu_temp is not None else 0,
+            'gpu_temp': self.gpu_temp if self.gpu_temp is not None else 0,
+            'cpu_fan_rpm': self.cpu_fan_rpm,
+            'gpu_fan_rpm': self.gpu_fan_rpm,
+            'battery_temp': self.battery_temp,
+            'timestamp': self.timestamp
+        }
 
-        for label, speed in fan_speeds:
-            if "gpu" in label.lower() or "fan2" in label.lower():  # Common labels for GPU fans
-                return int(speed)
 
-        # If GPU label isn't found, return the second available fan speed as fallback
-        return int(fan_speeds[1][1]) if len(fan_speeds) > 1 else None
-    except Exception:
-        return None
\ No newline at end of file
+def take_snapshot(battery_temp=None):
+    """Read every sensor once and return the result as a HardwareSnapshot."""
+    gpu_temp = get_gpu_temp()
+    return HardwareSnapshot(
+        cpu_temp=get_cpu_temp(),
+        gpu_temp=None if isinstance(gpu_temp, str) else gpu_temp,
+        cpu_fan_rpm=get_cpu_fan_speed(),
+        gpu_fan_rpm=get_gpu_fan_speed(),
+        battery_temp=battery_temp() if battery_temp else None
+    )
+
+
+class HardwareSampler:
+    """Refreshes the latest HardwareSnapshot on a background thread."""
+
+    def __init__(self, sample_fn, interval=1.0):
+        self.sample_fn = sample_fn
+        self.interval = interval
+        self.latest = None
+        self.listeners = []  # Called with every new snapshot
+        self._lock = threading.Lock()  # Serializes hardware reads
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="HardwareSampler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.interval + 1)
+        self._thread = None
+
+    def _run(self):
+        logging.info(f"Hardware sampler started ({self.interval * 1000:.0f} ms interval)")
+        while not self._stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Error in hardware sampler: {e}")
+            self._stop_event.wait(self.interval)
+        logging.info("Hardware sampler stopped")
+
+    def refresh(self):
+        """Take a new snapshot now and publish it as the latest one."""
+        with self._lock:
+            snapshot = self.sample_fn()
+            self.latest = snapshot
+        self._notify(snapshot)
+        return snapshot
+
+    def _notify(self, snapshot):
+        for listener in self.listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logging.error(f"Error in hardware sampler listener: {e}")
+
+    def get(self, max_age=None):
+        """Return the cached snapshot, re-reading only if it is older than `max_age` seconds."""
+        snapshot = self.latest
+        if snapshot is None or (max_age is not None and self.age(snapshot) > max_age):
+            fresh = None
+            with self._lock:
+                # Another caller may have refreshed while we waited for the lock
+                snapshot = self.latest
+                if snapshot is None or (max_age is not None and self.age(snapshot) > max_age):
+                    snapshot = fresh = self.sample_fn()
+                    self.latest = snapshot
+            if fresh is not None:
+                self._notify(fresh)
+        return snapshot
+
+    @staticmethod
+    def age(snapshot):
+        return time.monotonic() - snapshot.monotonic
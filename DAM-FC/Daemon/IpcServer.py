@@ -0,0 +1,421 @@
+# DAMFC_IpcServer v0.1.0
+# asyncio Unix-socket server for the daemon's JSON commands
+
+import os
+import json
+import socket
+import asyncio
+import logging
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Subscription:
+    """
+    Telemetry pushed to one session client.
+    A sample is queued when `interval` seconds have passed since the last one, or as soon
+    as any reading moved by at least `delta`. The queue is bounded; when a slow client
+    lets it fill up the oldest sample is dropped so the client always catches up to now.
+    """
+
+    DELTA_FIELDS = ("cpu_temp", "gpu_temp", "cpu_fan_rpm", "gpu_fan_rpm", "battery_temp")
+
+    def __init__(self, request_id, interval=None, delta=None, queue_size=8):
+        self.request_id = request_id
+        self.interval = interval
+        self.delta = delta
+        self.queue = asyncio.Queue(max(1, queue_size))
+        self.sent = 0
+        self.dropped = 0
+        self._last_time = None
+        self._last_data = None
+
+    def wants(self, data, now):
+        if self._last_time is None:
+            return True
+        if self.delta is not None:
+            for field in self.DELTA_FIELDS:
+                new, old = data.get(field), self._last_data.get(field)
+                if new is not None and old is not None and abs(new - old) >= self.delta:
+                    return True
+        return self.interval is not None and now - self._last_time >= self.interval
+
+    def offer(self, data, now):
+        if not self.wants(data, now):
+            return
+        self._last_time = now
+        self._last_data = data
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(data)
+
+
+class IpcServer:
+    """
+    Serves many clients concurrently on a Unix socket.
+    Commands run on a thread pool so the event loop never blocks; commands listed in
+    `blocking_commands` (driver builds, module loads) get their own small pool so they
+    cannot starve quick queries such as get_temp.
+
+    Two wire formats are accepted on the same socket:
+      * one-shot: a single JSON command without an "id", possibly spanning several
+        lines; the raw response (if any) is sent back and the connection is closed. This
+        is what the GUI uses.
+      * session: newline-delimited JSON commands carrying an "id". The connection stays
+        open, commands may be pipelined, and every command gets exactly one reply line
+        {"id": ..., "ok": true, "result": ...} or {"id": ..., "ok": false, "error": ...},
+        possibly out of order.
+
+    In a session, {"type": "subscribe", "interval_ms": ..., "delta": ...} makes the server
+    push {"id": <subscribe id>, "event": "snapshot", "data": {...}} lines for every sample
+    handed to publish(), until {"type": "unsubscribe", "subscription": <subscribe id>}.
+    Each sample is read once and fanned out to all subscribers.
+    """
+
+    MAX_MESSAGE_SIZE = 1024 * 1024
+    MAX_PIPELINE = 32  # In-flight commands per session before we stop reading
+    READ_SIZE = 65536
+
+    def __init__(self, handler, socket_path, blocking_commands=(), max_workers=8, max_blocking_workers=2,
+                 on_subscriptions_changed=None, on_listening=None, stop_signals=()):
+        self.handler = handler
+        self.socket_path = socket_path
+        self.blocking_commands = frozenset(blocking_commands)
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="ipc")
+        self.blocking_executor = ThreadPoolExecutor(max_blocking_workers, thread_name_prefix="ipc-blocking")
+        # Called with the shortest subscription interval (or None) whenever it changes
+        self.on_subscriptions_changed = on_subscriptions_changed
+        # Called once the socket accepts connections
+        self.on_listening = on_listening
+        # Signals that stop the server, handled by the event loop (main thread only)
+        self.stop_signals = tuple(stop_signals)
+        self.subscriptions = set()
+        self._loop = None
+        self._stopped = None
+        self._stop_requested = False  # stop() called before the loop was running
+        self._clients = {}  # Handler task -> writer of every open connection
+        self._tasks = set()  # Session commands still running
+
+    def run(self):
+        """Serve until stop() is called."""
+        asyncio.run(self.serve())
+
+    def stop(self):
+        self._stop_requested = True
+        if self._loop is not None and self._stopped is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    def _signal_received(self, signum):
+        logging.info(f"Received signal {signum}, stopping the socket server")
+        self._stopped.set()
+
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        for signum in self.stop_signals:
+            self._loop.add_signal_handler(signum, self._signal_received, signum)
+        if self._stop_requested:
+            return
+
+        logging.info(f"Preparing Unix socket at {self.socket_path}")
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path)
+        # Set socket permissions to allow non-root access if needed
+        os.chmod(self.socket_path, 0o666)
+        logging.info("Socket listening for connections")
+        if self.on_listening is not None:
+            self.on_listening()
+
+        try:
+            async with server:
+                await self._stopped.wait()
+                # Since 3.12 closing the server waits for every connection, so drop them first
+                server.close()
+                await self._close_clients()
+        finally:
+            self.executor.shutdown(wait=False)
+            self.blocking_executor.shutdown(wait=False)
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    async def _close_clients(self):
+        for task in list(self._tasks):
+            task.cancel()
+        for task, writer in list(self._clients.items()):
+            writer.close()
+            task.cancel()
+        if self._clients:
+            await asyncio.wait(list(self._clients), timeout=1.0)
+
+    async def handle_client(self, reader, writer):
+        task = asyncio.current_task()
+        self._clients[task] = writer
+        try:
+            command, rest, session = await self._read_first_message(reader)
+            if command is None:
+                return
+            if session:
+                await self.serve_session(command, rest, reader, writer)
+            else:
+                await self.serve_one_shot(command, writer)
+        except json.JSONDecodeError:
+            logging.error("Invalid JSON received")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            logging.debug("Client disconnected early")
+        except asyncio.CancelledError:
+            # Server shutting down while the command was still running
+            pass
+        except Exception as e:
+            logging.error(f"Error processing socket command: {e}")
+        finally:
+            self._clients.pop(task, None)
+            writer.close()
+
+    async def _read_first_message(self, reader):
+        """
+        Read the first command and return (command, rest, session); command is None when
+        the client sent nothing. A one-shot command is one JSON document that may span
+        several lines. It is a session only if the first line alone is an object with an
+        "id"; `rest` then holds whatever followed that line.
+        """
+        buffer = b''
+        while True:
+            chunk = await reader.read(self.READ_SIZE)
+            buffer += chunk
+            if not buffer.strip():
+                if not chunk:
+                    return None, b'', False
+                continue
+
+            complete, command = self._parse(buffer)
+            if complete:
+                return command, b'', isinstance(command, dict) and 'id' in command
+            line, newline, rest = buffer.partition(b'\n')
+            if newline:
+                complete, command = self._parse(line)
+                if complete and isinstance(command, dict) and 'id' in command:
+                    return command, rest, True
+
+            if not chunk:
+                raise json.JSONDecodeError("Incomplete command", buffer.decode(errors='replace'), len(buffer))
+            if len(buffer) > self.MAX_MESSAGE_SIZE:
+                raise ValueError(f"Message larger than {self.MAX_MESSAGE_SIZE} bytes")
+            # Otherwise a large payload split across several reads
+
+    @staticmethod
+    def _parse(data):
+        """(True, value) if `data` is one complete JSON document, else (False, None)."""
+        try:
+            return True, json.loads(data.decode())
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return False, None
+
+    async def serve_one_shot(self, command, writer):
+        try:
+            response = await self.dispatch(command)
+        except KeyError as e:
+            logging.error(f"Missing key in command: {e}")
+            return
+        except Exception as e:
+            logging.error(f"Error processing command: {e}")
+            return
+
+        # Send response back if there is one
+        if response:
+            writer.write(json.dumps(response).encode())
+            await writer.drain()
+
+    async def serve_session(self, first_command, buffer, reader, writer):
+        write_lock = asyncio.Lock()
+        in_flight = asyncio.Semaphore(self.MAX_PIPELINE)
+        tasks = set()
+        subscriptions = {}  # request id -> (Subscription, sender task)
+
+        async def start(command):
+            if isinstance(command, dict) and command.get('type') in ('subscribe', 'unsubscribe'):
+                reply = self._handle_subscription(command, subscriptions, writer, write_lock)
+                await self._write(writer, write_lock, reply)
+                return
+            await in_flight.acquire()
+            task = asyncio.create_task(self._answer(command, writer, write_lock, in_flight))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        await start(first_command)
+        try:
+            while True:
+                while b'\n' in buffer:
+                    line, _, buffer = buffer.partition(b'\n')
+                    if line.strip():
+                        await start(self._parse_line(line))
+                if len(buffer) > self.MAX_MESSAGE_SIZE:
+                    raise ValueError(f"Message larger than {self.MAX_MESSAGE_SIZE} bytes")
+                chunk = await reader.read(self.READ_SIZE)
+                if not chunk:
+                    break
+                buffer += chunk
+        finally:
+            for request_id in list(subscriptions):
+                self._unsubscribe(request_id, subscriptions)
+            # Let pipelined commands finish and reply before the connection closes
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _handle_subscription(self, command, subscriptions, writer, write_lock):
+        request_id = command.get('id')
+        try:
+            if command['type'] == 'unsubscribe':
+                target = command.get('subscription')
+                if target not in subscriptions:
+                    raise ValueError(f"No such subscription: {target}")
+                subscription = self._unsubscribe(target, subscriptions)
+                return {'id': request_id, 'ok': True,
+                        'result': {'sent': subscription.sent, 'dropped': subscription.dropped}}
+
+            if request_id in subscriptions:
+                raise ValueError(f"Subscription id already in use: {request_id}")
+            interval_ms = command.get('interval_ms')
+            delta = command.get('delta')
+            if interval_ms is None and delta is None:
+                interval_ms = 1000
+            subscription = Subscription(
+                request_id,
+                None if interval_ms is None else float(interval_ms) / 1000,
+                None if delta is None else float(delta),
+                int(command.get('queue', 8))
+            )
+        except (TypeError, ValueError) as e:
+            return {'id': request_id, 'ok': False, 'error': str(e)}
+
+        sender = asyncio.create_task(self._push(subscription, writer, write_lock))
+        subscriptions[request_id] = (subscription, sender)
+        self.subscriptions.add(subscription)
+        self._subscriptions_changed()
+        return {'id': request_id, 'ok': True, 'result': {'subscription': request_id}}
+
+    def _unsubscribe(self, request_id, subscriptions):
+        subscription, sender = subscriptions.pop(request_id)
+        sender.cancel()
+        self.subscriptions.discard(subscription)
+        self._subscriptions_changed()
+        return subscription
+
+    def _subscriptions_changed(self):
+        if self.on_subscriptions_changed is None:
+            return
+        intervals = [sub.interval for sub in self.subscriptions if sub.interval is not None]
+        try:
+            self.on_subscriptions_changed(min(intervals) if intervals else None)
+        except Exception as e:
+            logging.error(f"Error in subscription change callback: {e}")
+
+    async def _push(self, subscription, writer, write_lock):
+        try:
+            while True:
+                data = await subscription.queue.get()
+                # drain() blocks while the client is slow; meanwhile offer() drops the oldest samples
+                await self._write(writer, write_lock,
+                                  {'id': subscription.request_id, 'event': 'snapshot', 'data': data})
+                subscription.sent += 1
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+    def publish(self, data):
+        """Fan one telemetry sample out to every subscriber; safe to call from any thread."""
+        if self.subscriptions and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._fan_out, data)
+
+    def _fan_out(self, data):
+        now = self._loop.time()
+        for subscription in list(self.subscriptions):
+            subscription.offer(data, now)
+
+    @staticmethod
+    async def _write(writer, write_lock, message):
+        async with write_lock:
+            writer.write((json.dumps(message) + '\n').encode())
+            await writer.drain()
+
+    @staticmethod
+    def _parse_line(line):
+        try:
+            return json.loads(line.decode())
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            return ValueError(f"Invalid JSON: {e}")
+
+    async def _answer(self, command, writer, write_lock, in_flight):
+        request_id = command.get('id') if isinstance(command, dict) else None
+        try:
+            if isinstance(command, Exception):
+                raise command
+            reply = {'id': request_id, 'ok': True, 'result': await self.dispatch(command)}
+        except KeyError as e:
+            reply = {'id': request_id, 'ok': False, 'error': f"Missing key in command: {e}"}
+        except Exception as e:
+            reply = {'id': request_id, 'ok': False, 'error': str(e)}
+        finally:
+            in_flight.release()
+
+        await self._write(writer, write_lock, reply)
+
+    async def dispatch(self, command):
+        """Run the handler for one command on the matching executor."""
+        executor = self.blocking_executor if self.is_blocking(command) else self.executor
+        return await asyncio.get_running_loop().run_in_executor(executor, self.handler, command)
+
+    def is_blocking(self, command):
+        if not isinstance(command, dict):
+            return False
+        if command.get('type') == 'batch' and isinstance(command.get('commands'), list):
+            return any(self.is_blocking(entry) for entry in command['commands'])
+        return command.get('type') in self.blocking_commands
+
+
+class IpcError(Exception):
+    """Error reply from the daemon to a session command."""
+
+
+class IpcClient:
+    """Small blocking client for the session protocol, for scripts and benchmarks."""
+
+    def __init__(self, socket_path='/var/run/fan_control_daemon.sock', timeout=None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_path)
+        self._file = self.sock.makefile('rb')
+        self._ids = itertools.count(1)
+
+    def send(self, command_type, **params):
+        """Send a command without waiting for the reply; returns its request id."""
+        request_id = next(self._ids)
+        command = dict(params, type=command_type, id=request_id)
+        self.sock.sendall((json.dumps(command) + '\n').encode())
+        return request_id
+
+    def receive(self):
+        """Return the next reply line as a dict."""
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Daemon closed the connection")
+        return json.loads(line.decode())
+
+    def request(self, command_type, **params):
+        """Send one command and return its result, raising IpcError on failure."""
+        request_id = self.send(command_type, **params)
+        while True:
+            reply = self.receive()
+            # Skip replies to pipelined commands and pushed subscription events
+            if reply.get('id') == request_id and 'event' not in reply:
+                break
+        if not reply.get('ok'):
+            raise IpcError(reply.get('error'))
+        return reply.get('result')
+
+    def close(self):
+        self._file.close()
+        self.sock.close()
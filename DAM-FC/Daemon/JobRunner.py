@@ -0,0 +1,104 @@
+# DAMFC_JobRunner v0.1.0
+# Background execution of long driver operations with progress polling
+
+import time
+import queue
+import logging
+import itertools
+import threading
+from collections import deque
+
+
+class Job:
+    """One submitted operation and the tail of its output."""
+
+    def __init__(self, job_id, kind, group, fn, output_lines=200):
+        self.id = job_id
+        self.kind = kind
+        self.group = group
+        self.fn = fn
+        self.state = "queued"
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.output = deque(maxlen=output_lines)
+
+    def log(self, line):
+        self.output.append(line)
+
+    def to_dict(self, tail=50):
+        now = time.time()
+        end = self.finished if self.finished is not None else now
+        lines = list(self.output)
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'state': self.state,
+            'result': self.result,
+            'error': self.error,
+            'queued_s': round((self.started or now) - self.created, 3),
+            'elapsed_s': round(end - self.started, 3) if self.started is not None else 0.0,
+            'output': lines[-tail:] if tail else []
+        }
+
+
+class JobRunner:
+    """
+    Runs jobs on one worker thread per conflict group, so jobs of the same group
+    (e.g. make clean and insmod on the fan driver) never overlap and run in submission
+    order, while submit() and get() return immediately.
+    """
+
+    def __init__(self, max_finished=50):
+        self.max_finished = max_finished
+        self._ids = itertools.count(1)
+        self._jobs = {}
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, group="default"):
+        """Queue fn(job) and return the Job; a truthy return value marks it succeeded."""
+        with self._lock:
+            job = Job(next(self._ids), kind, group, fn)
+            self._jobs[job.id] = job
+            self._prune()
+            work = self._queues.get(group)
+            if work is None:
+                work = self._queues[group] = queue.Queue()
+                worker = threading.Thread(target=self._work, args=(work,), name=f"jobs-{group}")
+                worker.daemon = True
+                worker.start()
+        work.put(job)
+        logging.info(f"Queued job {job.id}: {kind}")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if job.finished is not None]
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job.id]
+
+    def _work(self, work):
+        while True:
+            job = work.get()
+            job.state = "running"
+            job.started = time.time()
+            logging.info(f"Running job {job.id}: {job.kind}")
+            try:
+                job.result = job.fn(job)
+                job.state = "succeeded" if job.result else "failed"
+            except Exception as e:
+                logging.error(f"Job {job.id} ({job.kind}) failed: {e}")
+                job.error = str(e)
+                job.state = "failed"
+            job.finished = time.time()
+            logging.info(f"Job {job.id} {job.state} after {job.finished - job.started:.1f}s")
@@ -0,0 +1,44 @@
+# DAMFC_Metrics v0.1.0
+# Lightweight counters shared by the daemon components
+
+
+class LatencyHistogram:
+    """Latency histogram with power-of-two microsecond buckets."""
+
+    def __init__(self, buckets=32):
+        self.counts = [0] * buckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        micros = int(seconds * 1_000_000)
+        # Bucket i holds latencies in [2^(i-1), 2^i) microseconds
+        self.counts[min(micros.bit_length(), len(self.counts) - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent):
+        """Return the upper bound, in microseconds, of the bucket holding `percent`."""
+        if self.count == 0:
+            return 0
+        rank = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return (1 << index) - 1 if index else 0
+        return (1 << (len(self.counts) - 1)) - 1
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean_us': int(self.total / self.count * 1_000_000) if self.count else 0,
+            'p50_us': self.percentile(50),
+            'p95_us': self.percentile(95),
+            'p99_us': self.percentile(99),
+            'max_us': int(self.max * 1_000_000),
+            'buckets_us': {(1 << index) - 1: count for index, count in enumerate(self.counts) if count}
+        }
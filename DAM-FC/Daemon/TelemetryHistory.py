@@ -0,0 +1,172 @@
+# DAMFC_TelemetryHistory v0.1.0
+# Fixed-memory history of temperatures, fan targets and fan RPMs
+
+import time
+import threading
+from array import array
+
+CHANNELS = ("cpu_temp", "gpu_temp", "cpu_fan_target", "gpu_fan_target", "cpu_fan_rpm", "gpu_fan_rpm")
+MISSING = -32768  # Stored in place of readings that were unavailable
+
+# (resolution in seconds, number of slots): 1 h at 1 s, 24 h at 10 s, 7 days at 1 min
+DEFAULT_TIERS = ((1, 3600), (10, 8640), (60, 10080))
+
+
+class RingBuffer:
+    """Preallocated columnar ring buffer of int16 samples keyed by epoch second."""
+
+    def __init__(self, capacity, channels=CHANNELS):
+        self.capacity = capacity
+        self.channels = channels
+        self.times = array('q', [0]) * capacity
+        self.columns = {channel: array('h', [MISSING]) * capacity for channel in channels}
+        self.head = 0  # Index of the next slot to write
+        self.count = 0
+
+    def append(self, timestamp, values):
+        index = self.head
+        self.times[index] = timestamp
+        for channel in self.channels:
+            self.columns[channel][index] = values.get(channel, MISSING)
+        self.head = (index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def query(self, start, end, max_points=None):
+        """
+        Return (timestamps, {channel: values}) for slots with start <= t <= end, oldest first.
+        Slots are appended in time order, so the range is found by bisection; with
+        `max_points` only every n-th slot of it is returned to stay within that many.
+        """
+        first = (self.head - self.count) % self.capacity
+        low = self._bisect(first, start)
+        high = self._bisect(first, end, right=True)
+        step = 1
+        if max_points is not None and high - low > max_points:
+            step = -(-(high - low) // max(1, max_points))
+        indices = [(first + i) % self.capacity for i in range(low, high, step)]
+        timestamps = [self.times[index] for index in indices]
+        columns = {}
+        for channel in self.channels:
+            column = self.columns[channel]
+            columns[channel] = [None if column[index] == MISSING else column[index] for index in indices]
+        return timestamps, columns
+
+    def _bisect(self, first, value, right=False):
+        """Position (oldest = 0) of the first slot with time >= value, or > value if `right`."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            timestamp = self.times[(first + middle) % self.capacity]
+            if timestamp < value or (right and timestamp == value):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def oldest(self):
+        if self.count == 0:
+            return None
+        return self.times[(self.head - self.count) % self.capacity]
+
+    def nbytes(self):
+        return self.times.itemsize * self.capacity + sum(
+            column.itemsize * self.capacity for column in self.columns.values()
+        )
+
+
+class HistoryTier:
+    """A ring buffer fed with the average of all samples falling in each bucket."""
+
+    def __init__(self, resolution, capacity, channels=CHANNELS):
+        self.resolution = resolution
+        self.channels = channels
+        self.ring = RingBuffer(capacity, channels)
+        self._bucket = None
+        self._sums = dict.fromkeys(channels, 0)
+        self._counts = dict.fromkeys(channels, 0)
+
+    def add(self, timestamp, values):
+        bucket = int(timestamp) // self.resolution * self.resolution
+        if bucket != self._bucket:
+            self.flush()
+            self._bucket = bucket
+        for channel in self.channels:
+            value = values.get(channel)
+            if value is not None:
+                self._sums[channel] += value
+                self._counts[channel] += 1
+
+    def flush(self):
+        """Write the in-progress bucket (if any) to the ring buffer."""
+        if self._bucket is None:
+            return
+        averaged = {}
+        for channel in self.channels:
+            if self._counts[channel]:
+                averaged[channel] = int(round(self._sums[channel] / self._counts[channel]))
+            self._sums[channel] = 0
+            self._counts[channel] = 0
+        self.ring.append(self._bucket, averaged)
+        self._bucket = None
+
+    def covers(self, start):
+        oldest = self.ring.oldest()
+        return oldest is not None and oldest <= start
+
+
+class TelemetryHistory:
+    """Multi-resolution telemetry history whose memory use is fixed at construction."""
+
+    def __init__(self, tiers=DEFAULT_TIERS, channels=CHANNELS):
+        self.channels = channels
+        self.tiers = [HistoryTier(resolution, capacity, channels) for resolution, capacity in tiers]
+        self._lock = threading.Lock()
+
+    def record(self, timestamp, values):
+        """Add one sample; values outside the int16 range or None are stored as missing."""
+        clean = {}
+        for channel in self.channels:
+            value = values.get(channel)
+            if value is not None and MISSING < value <= 32767:
+                clean[channel] = int(value)
+        with self._lock:
+            for tier in self.tiers:
+                tier.add(timestamp, clean)
+
+    def query(self, start=None, end=None, resolution=None, max_points=1000):
+        """
+        Return the samples between `start` and `end` (epoch seconds) in one columnar dict.
+        Without an explicit `resolution` the finest tier that still covers `start` and
+        returns at most `max_points` samples is used. If the chosen tier holds more
+        samples than that in the range, every n-th one is returned.
+        """
+        end = time.time() if end is None else end
+        start = end - 600 if start is None else start
+
+        with self._lock:
+            tier = self._select_tier(start, end, resolution, max_points)
+            timestamps, columns = tier.ring.query(start, end, max_points)
+
+        response = {'resolution': tier.resolution, 'start': start, 'end': end, 'timestamps': timestamps}
+        response.update(columns)
+        return response
+
+    def _select_tier(self, start, end, resolution, max_points):
+        if resolution is not None:
+            for tier in self.tiers:
+                if tier.resolution == resolution:
+                    return tier
+            raise ValueError(f"Unknown history resolution: {resolution}")
+
+        for tier in self.tiers:
+            if tier.covers(start) and (end - start) / tier.resolution <= max_points:
+                return tier
+        # Right after startup no tier reaches back far enough yet
+        for tier in self.tiers:
+            if (end - start) / tier.resolution <= max_points:
+                return tier
+        # Fall back to the tier with the longest retention
+        return self.tiers[-1]
+
+    def nbytes(self):
+        return sum(tier.ring.nbytes() for tier in self.tiers)